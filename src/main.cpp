@@ -39,6 +39,25 @@ Adafruit_MPU6050 mpu;
 #define KEYEXPRSUB "computer/**"
 #define VALUE "[ARDUINO]{ESP32} Publication from Zenoh-Pico!"
 
+// Set to 0 to publish the legacy JSON samples instead of binary records
+#define IMU_BINARY 1
+#define IMU_VERSION 1
+#define IMU_KIND_RECORD 1
+#define IMU_ENCODING "application/octet-stream;imu/v1"
+
+// Fixed 40-byte little-endian layout, mirrored by zenoh_scripts/common/imu_codec.py
+typedef struct __attribute__((packed)) {
+    uint8_t version;
+    uint8_t kind;
+    uint16_t action;
+    uint32_t seq;
+    uint32_t timestamp_ms;
+    float ax, ay, az;
+    float gx, gy, gz;
+    float tempC;
+} ImuRecord;
+static_assert(sizeof(ImuRecord) == 40, "ImuRecord layout must match imu_codec.IMU_RECORD");
+
 z_owned_session_t s;
 z_owned_publisher_t pub;
 z_owned_subscriber_t sub;
@@ -238,12 +257,26 @@ void setup() {
 
 void loop() {
     delay(500);
-    // adapted from https://registry.platformio.org/libraries/bblanchon/ArduinoJson
-    JsonDocument doc;
-    
+
     sensors_event_t a, g, temp;
     mpu.getEvent(&a, &g, &temp);
 
+    z_owned_bytes_t payload;
+    z_owned_encoding_t encoding;
+#if IMU_BINARY == 1
+    ImuRecord record = {IMU_VERSION,      IMU_KIND_RECORD,  (uint16_t)action, (uint32_t)idx++,
+                        (uint32_t)millis(), a.acceleration.x, a.acceleration.y, a.acceleration.z,
+                        g.gyro.x,         g.gyro.y,         g.gyro.z,         temp.temperature};
+
+    Serial.printf("Writing IMU record %u ('%s', %u bytes)\n", (unsigned)record.seq, KEYEXPRPUB,
+                  (unsigned)sizeof(record));
+
+    z_bytes_copy_from_buf(&payload, (const uint8_t*)&record, sizeof(record));
+    z_encoding_from_str(&encoding, IMU_ENCODING);
+#else
+    // adapted from https://registry.platformio.org/libraries/bblanchon/ArduinoJson
+    JsonDocument doc;
+
     // Accelerometer (m/s^2)
     doc["ax"] = a.acceleration.x;
     doc["ay"] = a.acceleration.y;
@@ -270,11 +303,9 @@ void loop() {
     Serial.print(json_buf);
     Serial.println("')");
 
-    z_owned_bytes_t payload;
     z_bytes_copy_from_str(&payload, json_buf);
-
-    z_owned_encoding_t encoding;
     z_encoding_from_str(&encoding, "text/json");
+#endif
 
     z_publisher_put_options_t options;
     z_publisher_put_options_default(&options);
@@ -0,0 +1,101 @@
+"""Pluggable action classifiers over IMU windows, run in worker processes.
+
+A model maps a batch of flattened windows, shaped (B, window * channels),
+to class probabilities (B, classes). Two backends are provided:
+
+- `MlpModel`: a NumPy multi-layer perceptron loaded from an `.npz` with
+  `W0, b0, W1, b1, ...` (ReLU between layers, softmax at the end) and
+  optional `mean`/`std` input normalisation. Without weights, a seeded
+  random MLP stands in so the pipeline can be exercised end to end.
+- `OnnxModel`: any `.onnx` model, if onnxruntime is installed.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class MlpModel:
+    def __init__(self, weights, biases, mean=None, std=None):
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.mean = mean
+        self.std = std
+
+    @classmethod
+    def load(cls, path: str) -> "MlpModel":
+        with np.load(path) as data:
+            layers = len([name for name in data.files if name.startswith("W")])
+            return cls(
+                [data[f"W{i}"] for i in range(layers)],
+                [data[f"b{i}"] for i in range(layers)],
+                data["mean"] if "mean" in data.files else None,
+                data["std"] if "std" in data.files else None,
+            )
+
+    @classmethod
+    def random(cls, input_size: int, classes: int, hidden: int = 64, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        sizes = [input_size, hidden, classes]
+        return cls(
+            [
+                rng.normal(0, np.sqrt(2.0 / n_in), (n_in, n_out))
+                for n_in, n_out in zip(sizes, sizes[1:])
+            ],
+            [np.zeros(n_out) for n_out in sizes[1:]],
+        )
+
+    def predict(self, inputs: np.ndarray) -> np.ndarray:
+        x = inputs.astype(np.float32)
+        if self.mean is not None:
+            x = (x - self.mean) / self.std
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ w + b
+            if i < len(self.weights) - 1:
+                np.maximum(x, 0, out=x)
+        x -= x.max(axis=1, keepdims=True)
+        np.exp(x, out=x)
+        return x / x.sum(axis=1, keepdims=True)
+
+
+class OnnxModel:
+    def __init__(self, path: str):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ValueError(
+                "ONNX models require onnxruntime (pip install onnxruntime)"
+            )
+        options = onnxruntime.SessionOptions()
+        # One thread per worker process; the pool provides the parallelism
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(path, options)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, inputs: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: inputs.astype(np.float32)})[0]
+
+
+def load_model(path: Optional[str], input_size: int, classes: int):
+    if path is None:
+        return MlpModel.random(input_size, classes)
+    if path.endswith(".onnx"):
+        return OnnxModel(path)
+    return MlpModel.load(path)
+
+
+# Worker process side: the model is loaded once per process by the pool
+# initializer, and only the batch crosses the process boundary per call.
+_model = None
+
+
+def init_worker(path: Optional[str], input_size: int, classes: int) -> None:
+    global _model
+    _model = load_model(path, input_size, classes)
+
+
+def classify(windows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the most likely class and its probability for each window."""
+    probabilities = _model.predict(windows.reshape(len(windows), -1))
+    classes = probabilities.argmax(axis=1)
+    return classes, probabilities[np.arange(len(classes)), classes]
@@ -0,0 +1,126 @@
+"""Console logging that keeps formatting and terminal I/O off zenoh callbacks.
+
+Callbacks push a formatter and its arguments onto a deque; a background thread
+renders and writes them in batches. The callback side only holds a lock long
+enough to count and append a record, and never blocks on the terminal:
+
+    log.sample(lambda s: f"Received '{s.key_expr}': {s.payload.to_string()}", sample)
+
+Per-sample lines can be thinned out with `every` or silenced with `quiet`;
+`event` lines (statistics, warnings) are always written.
+"""
+
+import argparse
+import collections
+import sys
+import threading
+import time
+from typing import Callable, Optional, TextIO, Union
+
+Formatter = Union[str, Callable[..., str]]
+
+
+class CallbackLog:
+    def __init__(
+        self,
+        every: int = 1,
+        quiet: bool = False,
+        capacity: int = 65536,
+        interval: float = 0.05,
+        stream: Optional[TextIO] = None,
+    ):
+        if every <= 0:
+            raise ValueError(f"every must be positive, got {every}")
+        self.every = every
+        self.quiet = quiet
+        self.capacity = capacity
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self.seen = 0  # Per-sample calls, including skipped ones
+        self.dropped = 0  # Records discarded because the writer fell behind
+        self._records = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()  # Callbacks run on several threads
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="callback-log")
+        self._writer.daemon = True
+        self._writer.start()
+
+    def sample(self, fmt: Formatter, *args) -> None:
+        """Logs a per-sample line, subject to `quiet` and `every`."""
+        if self.quiet:
+            return
+        with self._lock:
+            self.seen += 1
+            keep = self.seen % self.every == 0
+        if keep:
+            self._push(fmt, args)
+
+    def event(self, fmt: Formatter, *args) -> None:
+        """Logs a line that is never sampled away."""
+        self._push(fmt, args)
+
+    def _push(self, fmt: Formatter, args: tuple) -> None:
+        with self._lock:
+            if len(self._records) >= self.capacity:
+                self.dropped += 1  # The deque evicts the oldest record
+            self._records.append((fmt, args))
+
+    def _drain(self) -> None:
+        lines = []
+        while True:
+            try:
+                fmt, args = self._records.popleft()
+            except IndexError:
+                break
+            try:
+                lines.append(fmt.format(*args) if isinstance(fmt, str) else fmt(*args))
+            except Exception as e:
+                lines.append(f"!! Log formatting failed: {e!r}")
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.append(f"!! {dropped} log records dropped")
+        if lines:
+            lines.append("")
+            self.stream.write("\n".join(lines))
+            self.stream.flush()
+
+    def _run(self) -> None:
+        # Polling keeps the callback side free of any condition to notify
+        while not self._closed:
+            self._drain()
+            time.sleep(self.interval)
+        self._drain()
+
+    def close(self) -> None:
+        """Writes out everything still queued and stops the writer."""
+        self._closed = True
+        self._writer.join()
+
+    def __enter__(self) -> "CallbackLog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def add_log_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--quiet",
+        "-q",
+        default=False,
+        action="store_true",
+        help="Do not log individual samples, only statistics and warnings.",
+    )
+    parser.add_argument(
+        "--log-every",
+        dest="log_every",
+        metavar="N",
+        default=1,
+        type=int,
+        help="Only log every Nth sample.",
+    )
+
+
+def get_log_from_args(args) -> CallbackLog:
+    return CallbackLog(every=args.log_every, quiet=args.quiet)
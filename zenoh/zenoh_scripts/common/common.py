@@ -81,3 +81,14 @@ def get_config_from_args(args) -> zenoh.Config:
         conf.insert_json5(key, value)
 
     return conf
+
+
+def normalize_parameters(parameters: zenoh.Parameters) -> zenoh.Parameters:
+    """Also accepts URL-style '&' between selector parameters (zenoh itself
+    only separates them with ';')."""
+    return zenoh.Parameters(str(parameters).replace("&", ";"))
+
+
+def query_parameters(query: zenoh.Query) -> zenoh.Parameters:
+    """The query's selector parameters, see `normalize_parameters`."""
+    return normalize_parameters(query.parameters)
@@ -0,0 +1,89 @@
+"""Per-chunk payload compression negotiated through selector parameters.
+
+The client lists the codecs it accepts in order of preference, e.g.
+`?compress=zstd,zlib`, and the server applies the first one it supports to
+each chunk independently, so chunks stay decodable in any order. The codec
+actually applied is reported in each reply's attachment; chunks that would
+not shrink, and formats that are already compressed, are sent as is.
+
+zstd needs the `zstandard` package; zlib is always available.
+"""
+
+import zlib
+from typing import Iterable, List, Optional
+
+DEFAULT_LEVELS = {"zstd": 3, "zlib": 6}
+
+# Media types whose content is already entropy coded
+COMPRESSED_TYPES = (
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "image/gif",
+    "audio/",
+    "video/",
+    "application/zip",
+    "application/gzip",
+    "application/zstd",
+    "application/x-xz",
+    "application/x-bzip2",
+)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def available_codecs() -> List[str]:
+    return (["zstd"] if _zstandard() is not None else []) + ["zlib"]
+
+
+def parse_codecs(value: Optional[str]) -> List[str]:
+    """`"zstd,zlib"` -> `["zstd", "zlib"]`."""
+    if not value:
+        return []
+    return [codec.strip().lower() for codec in value.split(",") if codec.strip()]
+
+
+def is_compressed_type(mime: str) -> bool:
+    return mime.startswith(COMPRESSED_TYPES)
+
+
+def negotiate(requested: Iterable[str], mime: str) -> Optional[str]:
+    """Picks the first requested codec this side supports, or None when the
+    content would not benefit."""
+    if is_compressed_type(mime):
+        return None
+    available = available_codecs()
+    for codec in requested:
+        if codec in available:
+            return codec
+    return None
+
+
+def compress(codec: str, data: bytes, level: Optional[int] = None) -> bytes:
+    if level is None:
+        level = DEFAULT_LEVELS[codec]
+    if codec == "zstd":
+        return _zstandard().ZstdCompressor(level=level).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, level)
+    raise ValueError(f"Unknown codec {codec!r}")
+
+
+def decompress(codec: Optional[str], data: bytes) -> bytes:
+    if codec is None:
+        return data
+    if codec == "zstd":
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise ValueError("zstd payloads require zstandard (pip install zstandard)")
+        # Chunks are compressed in one call, so their frames record the size
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown codec {codec!r}")
@@ -0,0 +1,207 @@
+"""Reports files created, rewritten, moved or deleted under a directory tree.
+
+On Linux the kernel's inotify is used through libc, so an idle directory
+costs nothing; elsewhere, or if inotify is unavailable, the tree's sizes and
+mtimes are compared every `interval` seconds. Files are reported once they
+are closed after writing, or moved into place, never while half-written.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import traceback
+from typing import Callable, Dict, Optional, Tuple
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class DirectoryWatcher:
+    """Calls `on_change(name)` from a background thread with the '/'-separated
+    path, relative to `directory`, of every file that changed.
+
+    `include(name)` filters both files and directories, so excluded
+    subdirectories are neither watched nor scanned. Pass `use_inotify=False`
+    to poll, e.g. on network filesystems that do not report changes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        on_change: Callable[[str], None],
+        include: Callable[[str], bool] = lambda name: True,
+        interval: float = 1.0,
+        use_inotify: bool = True,
+    ):
+        self.directory = directory
+        self.on_change = on_change
+        self.include = include
+        self.interval = interval
+        self._stop = threading.Event()
+        self._libc = self._load_inotify() if use_inotify else None
+        self.mode = "inotify" if self._libc is not None else "poll"
+        self._thread = threading.Thread(
+            target=self._run_inotify if self._libc is not None else self._run_poll,
+            name="dir-watcher",
+            daemon=True,
+        )
+
+    def start(self) -> "DirectoryWatcher":
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(path, self.directory).replace(os.sep, "/")
+
+    def _notify(self, name: str):
+        # A failing callback must not end the watch
+        try:
+            self.on_change(name)
+        except Exception:
+            print(f"!! [Watcher] Handling a change of '{name}' failed")
+            traceback.print_exc()
+
+    # --- inotify --- --- --- --- --- ---
+
+    @staticmethod
+    def _load_inotify() -> Optional[ctypes.CDLL]:
+        name = ctypes.util.find_library("c")
+        if name is None:
+            return None
+        libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            return None
+        return libc
+
+    def _run_inotify(self):
+        fd = self._libc.inotify_init1(IN_NONBLOCK)
+        if fd < 0:
+            self.mode = "poll"
+            self._run_poll()
+            return
+        watches: Dict[int, str] = {}
+
+        def add_watch(path: str, report: bool):
+            wd = self._libc.inotify_add_watch(fd, os.fsencode(path), WATCH_MASK)
+            if wd >= 0:
+                watches[wd] = path
+            try:
+                entries = list(os.scandir(path))
+            except OSError:
+                return  # Removed or replaced since it was reported
+            for entry in entries:
+                name = self._relative(entry.path)
+                if not self.include(name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    add_watch(entry.path, report)
+                elif report:
+                    # Written before the new directory's watch existed
+                    self._notify(name)
+
+        try:
+            add_watch(self.directory, report=False)
+            # Only needed to tell what changed if the kernel drops events
+            known = set(self._scan())
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(fd, 64 * 1024)
+                for path, mask in self._parse(data, watches):
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were lost: watch any new directories and
+                        # report every file that exists or existed
+                        print("!! [Watcher] Event queue overflowed, rescanning")
+                        add_watch(self.directory, report=False)
+                        current = set(self._scan())
+                        for name in sorted(known | current):
+                            self._notify(name)
+                        known = current
+                        continue
+                    name = self._relative(path)
+                    if not self.include(name):
+                        continue
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            add_watch(path, report=True)
+                        continue
+                    if mask & IN_CREATE:
+                        continue  # Reported on IN_CLOSE_WRITE once written
+                    if mask & (IN_DELETE | IN_MOVED_FROM):
+                        known.discard(name)
+                    else:
+                        known.add(name)
+                    self._notify(name)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _parse(data: bytes, watches: Dict[int, str]):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                yield None, mask
+                continue
+            if mask & IN_DELETE_SELF:
+                watches.pop(wd, None)
+                continue
+            if wd in watches and name:
+                yield os.path.join(watches[wd], os.fsdecode(name)), mask
+
+    # --- polling --- --- --- --- --- ---
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [
+                d for d in dirs if self.include(self._relative(os.path.join(root, d)))
+            ]
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = self._relative(path)
+                if not self.include(name):
+                    continue
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[name] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def _run_poll(self):
+        previous = self._scan()
+        while not self._stop.wait(self.interval):
+            current = self._scan()
+            for name in sorted(previous.keys() | current.keys()):
+                if previous.get(name) != current.get(name):
+                    self._notify(name)
+            previous = current
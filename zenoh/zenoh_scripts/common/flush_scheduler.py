@@ -0,0 +1,55 @@
+"""Count-or-deadline window flushing on an asyncio event loop."""
+
+import asyncio
+from typing import Callable, Dict, Optional
+
+
+class FlushScheduler:
+    """Decides when each keyed window should be emitted.
+
+    A window is flushed as soon as `max_count` samples are pending, or
+    `interval` seconds after its first pending sample, whichever comes first.
+    Timers only exist while a window has pending samples, so idle keys cost no
+    wake-ups. All methods must run on `loop`; zenoh callbacks should hand
+    samples over with `loop.call_soon_threadsafe`.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        interval: float,
+        max_count: Optional[int],
+        on_flush: Callable[[str], None],
+    ):
+        self.loop = loop
+        self.interval = interval
+        self.max_count = max_count
+        self.on_flush = on_flush
+        self._pending: Dict[str, int] = {}
+        self._deadlines: Dict[str, asyncio.TimerHandle] = {}
+
+    def add(self, key: str, count: int = 1) -> None:
+        pending = self._pending.get(key, 0) + count
+        self._pending[key] = pending
+        if self.max_count is not None and pending >= self.max_count:
+            self.flush(key)
+        elif key not in self._deadlines:
+            self._deadlines[key] = self.loop.call_later(self.interval, self.flush, key)
+
+    def flush(self, key: str) -> None:
+        handle = self._deadlines.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+        if self._pending.pop(key, 0):
+            self.on_flush(key)
+
+    def close(self, flush: bool = True) -> None:
+        """Cancels all timers, first emitting the pending windows unless
+        `flush` is False."""
+        for handle in self._deadlines.values():
+            handle.cancel()
+        self._deadlines.clear()
+        pending, self._pending = self._pending, {}
+        if flush:
+            for key in pending:
+                self.on_flush(key)
@@ -0,0 +1,154 @@
+"""Time-indexed IMU history for one key: recent samples in memory, older on disk."""
+
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from common.imu_codec import SENSOR_FIELDS, ImuHistory
+
+HISTORY_DTYPE = np.dtype(
+    [
+        ("time_ns", "<i8"),
+        ("values", "<f4", (len(SENSOR_FIELDS),)),
+        ("action", "<u2"),
+    ]
+)
+
+
+class HistoryStore:
+    """Keeps the newest `capacity` samples of a key in preallocated columns.
+
+    When the columns fill up, the oldest half is appended to a spill segment
+    in one write and the rest is moved down, so the columns stay contiguous
+    and sorted by time and every lookup is a binary search. The spill segment
+    is rotated once it holds `spill_rows` rows, keeping at most one previous
+    segment, so disk use is bounded too. Without a `spill_path`, evicted
+    samples are dropped.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        spill_path: Optional[Path] = None,
+        spill_rows: int = 1 << 20,
+    ):
+        if capacity < 2:
+            raise ValueError(f"capacity must be at least 2, got {capacity}")
+        if spill_rows < capacity // 2:
+            # Every eviction spills at least half the capacity in one segment
+            raise ValueError(
+                f"spill_rows must be at least capacity // 2 ({capacity // 2}), "
+                f"got {spill_rows}"
+            )
+        self.capacity = capacity
+        self.spill_path = Path(spill_path) if spill_path is not None else None
+        self.spill_rows = spill_rows
+        self.time_ns = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, len(SENSOR_FIELDS)), dtype=np.float32)
+        self.action = np.zeros(capacity, dtype=np.uint16)
+        self.size = 0
+        self.spilled = 0  # Rows written to disk since start
+        self._lock = threading.Lock()
+
+    def append(self, time_ns: np.ndarray, values: np.ndarray, action: np.ndarray):
+        time_ns = np.asarray(time_ns, dtype=np.int64)
+        with self._lock:
+            # Keep times non-decreasing so lookups can bisect; only clock
+            # jumps between publishers of the same key get flattened
+            floor = self.time_ns[self.size - 1] if self.size else np.iinfo(np.int64).min
+            time_ns = np.maximum.accumulate(np.maximum(time_ns, floor))
+
+            overflow = self.size + len(time_ns) - self.capacity
+            if overflow > 0:
+                spilled = self._evict(
+                    max(overflow, self.capacity // 2), time_ns, values, action
+                )
+                time_ns = time_ns[spilled:]
+                values = values[spilled:]
+                action = action[spilled:]
+
+            start = self.size
+            end = start + len(time_ns)
+            self.time_ns[start:end] = time_ns
+            self.values[start:end] = values
+            self.action[start:end] = action
+            self.size = end
+
+    def _evict(self, count: int, time_ns, values, action) -> int:
+        """Spills the `count` oldest rows, continuing into the incoming rows
+        once memory is empty. Returns how many incoming rows were spilled."""
+        from_memory = min(count, self.size)
+        from_incoming = min(count - from_memory, len(time_ns))
+        rows = np.empty(from_memory + from_incoming, dtype=HISTORY_DTYPE)
+        rows["time_ns"][:from_memory] = self.time_ns[:from_memory]
+        rows["values"][:from_memory] = self.values[:from_memory]
+        rows["action"][:from_memory] = self.action[:from_memory]
+        rows["time_ns"][from_memory:] = time_ns[:from_incoming]
+        rows["values"][from_memory:] = values[:from_incoming]
+        rows["action"][from_memory:] = action[:from_incoming]
+        self._spill(rows)
+
+        kept = self.size - from_memory
+        self.time_ns[:kept] = self.time_ns[from_memory : self.size]
+        self.values[:kept] = self.values[from_memory : self.size]
+        self.action[:kept] = self.action[from_memory : self.size]
+        self.size = kept
+        return from_incoming
+
+    def _spill(self, rows: np.ndarray) -> None:
+        if self.spill_path is None or not len(rows):
+            return
+        existing = self._spill_count(self.spill_path)
+        if existing and existing + len(rows) > self.spill_rows:
+            os.replace(self.spill_path, self._previous_path())
+        with open(self.spill_path, "ab") as f:
+            f.write(rows.tobytes())
+        self.spilled += len(rows)
+
+    def _previous_path(self) -> Path:
+        return self.spill_path.with_name(self.spill_path.name + ".old")
+
+    @staticmethod
+    def _spill_count(path: Path) -> int:
+        try:
+            return path.stat().st_size // HISTORY_DTYPE.itemsize
+        except FileNotFoundError:
+            return 0
+
+    def _spilled_segments(self) -> List[np.ndarray]:
+        if self.spill_path is None:
+            return []
+        segments = []
+        for path in (self._previous_path(), self.spill_path):
+            count = self._spill_count(path)
+            if count:
+                # A torn last row is left out of the mapping
+                segments.append(np.memmap(path, HISTORY_DTYPE, "r", shape=(count,)))
+        return segments
+
+    def query(self, start_ns: int, end_ns: int) -> ImuHistory:
+        """Returns the samples with start_ns <= time_ns < end_ns, oldest first."""
+        times, values, actions = [], [], []
+        with self._lock:
+            for segment in self._spilled_segments():
+                column = segment["time_ns"]
+                lo, hi = np.searchsorted(column, [start_ns, end_ns])
+                if lo < hi:
+                    rows = segment[lo:hi]
+                    times.append(rows["time_ns"])
+                    values.append(rows["values"])
+                    actions.append(rows["action"])
+            column = self.time_ns[: self.size]
+            lo, hi = np.searchsorted(column, [start_ns, end_ns])
+            times.append(self.time_ns[lo:hi])
+            values.append(self.values[lo:hi])
+            actions.append(self.action[lo:hi])
+            # Concatenating copies, so the result outlives the lock
+            return ImuHistory(
+                np.concatenate(times),
+                np.concatenate(values),
+                np.concatenate(actions),
+            )
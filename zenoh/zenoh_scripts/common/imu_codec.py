@@ -0,0 +1,204 @@
+"""Binary wire format for IMU samples, with JSON kept as a fallback.
+
+A record is a fixed 40-byte little-endian struct, mirrored by `ImuRecord` in
+`src/main.cpp`:
+
+    version u8 | kind u8 | action u16 | seq u32 | timestamp_ms u32 |
+    ax ay az gx gy gz tempC f32
+
+A batch packs N consecutive samples column-wise after a 12-byte header, so
+the sensor block decodes straight into an (N, 7) array:
+
+    version u8 | kind u8 | count u16 | seq u32 | base_timestamp_ms u32 |
+    values f32[N][7] | action u16[N] | dt_ms u16[N]
+
+History replies use the same layout with absolute nanosecond times, since
+they span far more than a u16 of milliseconds:
+
+    version u8 | kind u8 | reserved u16 | count u32 |
+    time_ns i64[N] | values f32[N][7] | action u16[N]
+
+Publishers tag binary payloads with `IMU_ENCODING`; anything else is treated
+as the legacy JSON object, so old firmware and new subscribers interoperate.
+"""
+
+import json
+import struct
+from typing import NamedTuple, Optional
+
+import numpy as np
+import zenoh
+
+IMU_VERSION = 1
+KIND_RECORD = 1
+KIND_BATCH = 2
+KIND_HISTORY = 3
+
+IMU_ENCODING = zenoh.Encoding.APPLICATION_OCTET_STREAM.with_schema(
+    f"imu/v{IMU_VERSION}"
+)
+JSON_ENCODING = zenoh.Encoding.TEXT_JSON
+
+SENSOR_FIELDS = ("ax", "ay", "az", "gx", "gy", "gz", "tempC")
+
+IMU_RECORD = struct.Struct("<BBHII7f")
+BATCH_HEADER = struct.Struct("<BBHII")
+HISTORY_HEADER = struct.Struct("<BBHI")
+
+
+def encode_record(sample: dict, seq: int, timestamp_ms: int) -> bytes:
+    """Packs one sample dict (ax..gz, optional tempC and action) into a record."""
+    return IMU_RECORD.pack(
+        IMU_VERSION,
+        KIND_RECORD,
+        int(sample.get("action", 0)),
+        seq & 0xFFFFFFFF,
+        timestamp_ms & 0xFFFFFFFF,
+        *(float(sample.get(field, 0.0)) for field in SENSOR_FIELDS),
+    )
+
+
+def decode_record(payload: bytes) -> dict:
+    version, kind, action, seq, timestamp_ms, *values = IMU_RECORD.unpack(payload)
+    if version != IMU_VERSION or kind != KIND_RECORD:
+        raise ValueError(f"Unsupported IMU record version={version} kind={kind}")
+    record = dict(zip(SENSOR_FIELDS, values))
+    record["action"] = action
+    record["seq"] = seq
+    record["timestamp_ms"] = timestamp_ms
+    return record
+
+
+class ImuBatch(NamedTuple):
+    seq: int  # Sequence number of the first sample
+    values: np.ndarray  # (N, 7) float32, columns in SENSOR_FIELDS order
+    action: np.ndarray  # (N,) uint16
+    timestamp_ms: np.ndarray  # (N,) uint32
+
+
+def encode_batch(
+    values: np.ndarray, action: np.ndarray, timestamp_ms: np.ndarray, seq: int
+) -> bytes:
+    """Packs N samples into one frame; timestamps are stored relative to the first."""
+    values = np.ascontiguousarray(values, dtype="<f4")
+    count = values.shape[0]
+    if values.shape != (count, len(SENSOR_FIELDS)) or not 0 < count <= 0xFFFF:
+        raise ValueError(
+            f"Expected (N, {len(SENSOR_FIELDS)}) values, got {values.shape}"
+        )
+    timestamp_ms = np.asarray(timestamp_ms, dtype=np.int64)
+    base = int(timestamp_ms[0])
+    offsets = timestamp_ms - base
+    if offsets.min() < 0 or offsets.max() > 0xFFFF:
+        # Offsets are stored as u16 milliseconds
+        raise ValueError(
+            f"Batch spans {offsets.min()}..{offsets.max()}ms, "
+            "expected 0..65535ms after its first sample"
+        )
+    header = BATCH_HEADER.pack(
+        IMU_VERSION, KIND_BATCH, count, seq & 0xFFFFFFFF, base & 0xFFFFFFFF
+    )
+    return b"".join(
+        (
+            header,
+            values.tobytes(),
+            np.asarray(action, dtype="<u2").tobytes(),
+            offsets.astype("<u2").tobytes(),
+        )
+    )
+
+
+def decode_batch(payload: bytes) -> ImuBatch:
+    version, kind, count, seq, base = BATCH_HEADER.unpack_from(payload)
+    if version != IMU_VERSION or kind != KIND_BATCH:
+        raise ValueError(f"Unsupported IMU batch version={version} kind={kind}")
+    width = len(SENSOR_FIELDS)
+    expected = BATCH_HEADER.size + count * (4 * width + 4)
+    if len(payload) != expected:
+        raise ValueError(f"IMU batch of {count} samples should be {expected} bytes")
+    offset = BATCH_HEADER.size
+    values = np.frombuffer(payload, "<f4", count * width, offset).reshape(count, width)
+    offset += values.nbytes
+    action = np.frombuffer(payload, "<u2", count, offset)
+    offset += action.nbytes
+    dt_ms = np.frombuffer(payload, "<u2", count, offset)
+    return ImuBatch(seq, values, action, base + dt_ms.astype(np.uint32))
+
+
+def to_batch(record: dict) -> ImuBatch:
+    """Wraps a single decoded record (binary or JSON) as a batch of one."""
+    values = np.array(
+        [[record.get(field, 0.0) for field in SENSOR_FIELDS]], dtype=np.float32
+    )
+    return ImuBatch(
+        record.get("seq", 0),
+        values,
+        np.array([record.get("action", 0)], dtype=np.uint16),
+        np.array([record.get("timestamp_ms", 0)], dtype=np.uint32),
+    )
+
+
+class ImuHistory(NamedTuple):
+    time_ns: np.ndarray  # (N,) int64, HLC time of each sample
+    values: np.ndarray  # (N, 7) float32, columns in SENSOR_FIELDS order
+    action: np.ndarray  # (N,) uint16
+
+
+def encode_history(
+    time_ns: np.ndarray, values: np.ndarray, action: np.ndarray
+) -> bytes:
+    count = len(time_ns)
+    return b"".join(
+        (
+            HISTORY_HEADER.pack(IMU_VERSION, KIND_HISTORY, 0, count),
+            np.ascontiguousarray(time_ns, dtype="<i8").tobytes(),
+            np.ascontiguousarray(values, dtype="<f4").tobytes(),
+            np.ascontiguousarray(action, dtype="<u2").tobytes(),
+        )
+    )
+
+
+def decode_history(payload: bytes) -> ImuHistory:
+    version, kind, _, count = HISTORY_HEADER.unpack_from(payload)
+    if version != IMU_VERSION or kind != KIND_HISTORY:
+        raise ValueError(f"Unsupported IMU history version={version} kind={kind}")
+    width = len(SENSOR_FIELDS)
+    expected = HISTORY_HEADER.size + count * (8 + 4 * width + 2)
+    if len(payload) != expected:
+        raise ValueError(f"IMU history of {count} samples should be {expected} bytes")
+    offset = HISTORY_HEADER.size
+    time_ns = np.frombuffer(payload, "<i8", count, offset)
+    offset += time_ns.nbytes
+    values = np.frombuffer(payload, "<f4", count * width, offset).reshape(count, width)
+    offset += values.nbytes
+    action = np.frombuffer(payload, "<u2", count, offset)
+    return ImuHistory(time_ns, values, action)
+
+
+def is_binary(payload: bytes, encoding: Optional[zenoh.Encoding] = None) -> bool:
+    if encoding is not None and encoding == IMU_ENCODING:
+        return True
+    # Bridges may drop the encoding; JSON always starts with '{'
+    return len(payload) > 0 and payload[0] == IMU_VERSION
+
+
+def decode(payload: bytes, encoding: Optional[zenoh.Encoding] = None) -> dict:
+    """Decodes a binary record or a legacy JSON sample into a dict."""
+    if is_binary(payload, encoding):
+        return decode_record(payload)
+    return json.loads(payload)
+
+
+def decode_sample(sample: zenoh.Sample) -> dict:
+    return decode(sample.payload.to_bytes(), sample.encoding)
+
+
+def decode_frame(payload: bytes, encoding: Optional[zenoh.Encoding] = None) -> ImuBatch:
+    """Decodes a batch, a single record or a JSON sample into an `ImuBatch`."""
+    if is_binary(payload, encoding) and payload[1] == KIND_BATCH:
+        return decode_batch(payload)
+    return to_batch(decode(payload, encoding))
+
+
+def decode_frame_sample(sample: zenoh.Sample) -> ImuBatch:
+    return decode_frame(sample.payload.to_bytes(), sample.encoding)
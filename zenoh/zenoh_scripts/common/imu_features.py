@@ -0,0 +1,108 @@
+"""Windowed motion features over the six accelerometer and gyro channels."""
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from common.imu_codec import SENSOR_FIELDS
+
+MOTION_FIELDS = SENSOR_FIELDS[:6]  # ax ay az gx gy gz, tempC is left out
+
+DEFAULT_BANDS = (0.5, 3.0, 8.0, 20.0)  # Hz edges: posture, reps, tremor/impacts
+
+
+class SampleWindow:
+    """The last `capacity` rows of a multi-channel stream, with their times.
+
+    Rows are written into a preallocated ring; `values()` unrolls it oldest
+    first for the feature computation.
+    """
+
+    def __init__(self, capacity: int, channels: int):
+        self.capacity = capacity
+        self._values = np.zeros((capacity, channels), dtype=np.float32)
+        self._time_ms = np.zeros(capacity, dtype=np.int64)
+        self._head = 0
+        self.size = 0
+        self.pending = 0  # Rows pushed since the last emit
+
+    def push(self, values: np.ndarray, time_ms: np.ndarray) -> None:
+        n = len(values)
+        if n > self.capacity:
+            values, time_ms = values[-self.capacity :], time_ms[-self.capacity :]
+        positions = (self._head + np.arange(len(values))) % self.capacity
+        self._values[positions] = values
+        self._time_ms[positions] = time_ms
+        self._head = (self._head + len(values)) % self.capacity
+        self.size = min(self.capacity, self.size + len(values))
+        self.pending += n
+
+    def values(self):
+        start = (self._head - self.size) % self.capacity
+        order = (start + np.arange(self.size)) % self.capacity
+        return self._values[order], self._time_ms[order]
+
+
+def sample_rate(time_ms: np.ndarray) -> float:
+    """Median rate of a window, robust to the odd late or batched sample."""
+    dt = np.diff(time_ms)
+    dt = dt[dt > 0]
+    return 1000.0 / float(np.median(dt)) if len(dt) else 0.0
+
+
+def extract_features(
+    values: np.ndarray,
+    time_ms: np.ndarray,
+    bands: Sequence[float] = DEFAULT_BANDS,
+    rate: Optional[float] = None,
+) -> Dict[str, object]:
+    """Computes all features of an (N, 6) window in a handful of array passes.
+
+    Per-channel features are lists in MOTION_FIELDS order; band energies are
+    one list per channel, with one entry per band between consecutive edges.
+    `rate` is the nominal sample rate in Hz, used instead of the one derived
+    from `time_ms`; without it, a window whose timestamps do not advance
+    (e.g. JSON samples, which carry none) raises ValueError, since its band
+    energies and jerk could not be expressed in Hz and per second.
+    """
+    values = values.astype(np.float64)
+    accel, gyro = values[:, :3], values[:, 3:]
+    if rate is None:
+        rate = sample_rate(time_ms)
+        if not rate:
+            raise ValueError("window has no usable timestamps")
+
+    mean = values.mean(axis=0)
+    centered = values - mean
+    variance = (centered**2).mean(axis=0)
+
+    # Sign changes of the mean-removed signal, per channel
+    signs = np.signbit(centered)
+    zero_crossings = np.count_nonzero(signs[1:] != signs[:-1], axis=0)
+
+    # Rate of change of acceleration, from the actual sample spacing
+    dt = np.diff(time_ms).astype(np.float64) / 1000.0
+    dt[dt <= 0] = 1.0 / rate
+    jerk = np.linalg.norm(np.diff(accel, axis=0), axis=1) / dt
+    jerk_rms = float(np.sqrt(np.mean(jerk**2))) if len(jerk) else 0.0
+
+    # One real FFT over all channels, energies summed per band
+    spectrum = np.abs(np.fft.rfft(centered, axis=0)) ** 2 / len(values)
+    frequencies = np.fft.rfftfreq(len(values), d=1.0 / rate)
+    band_index = np.digitize(frequencies, bands) - 1
+    band_energy = np.zeros((len(bands) - 1, values.shape[1]))
+    valid = (band_index >= 0) & (band_index < len(bands) - 1)
+    np.add.at(band_energy, band_index[valid], spectrum[valid])
+
+    return {
+        "count": len(values),
+        "rate_hz": rate,
+        "mean": mean.tolist(),
+        "variance": variance.tolist(),
+        "accel_rms": float(np.sqrt(np.mean(np.sum(accel**2, axis=1)))),
+        "gyro_rms": float(np.sqrt(np.mean(np.sum(gyro**2, axis=1)))),
+        "jerk_rms": jerk_rms,
+        "zero_crossings": zero_crossings.tolist(),
+        "band_edges_hz": list(bands),
+        "band_energy": band_energy.T.tolist(),
+    }
@@ -0,0 +1,154 @@
+"""Bounded hand-off between zenoh callbacks and the code processing samples.
+
+zenoh delivers samples on its own threads; any time spent in a callback
+stalls delivery, and an advanced subscriber then reports misses. Callbacks
+should only `put` into an `IngestQueue` and let a consumer thread `get`.
+When the consumer falls behind, the policy decides what gives:
+
+- `drop-oldest`: evict the oldest queued sample (freshest data wins)
+- `drop-newest`: refuse the incoming sample (queued data wins)
+- `coalesce`: keep only the latest sample per key, in first-arrival order
+- `block`: make the callback wait for room (lossless, stalls zenoh)
+"""
+
+import argparse
+import collections
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+POLICIES = ("drop-oldest", "drop-newest", "coalesce", "block")
+
+
+class IngestQueue:
+    def __init__(self, capacity: int = 1024, policy: str = "drop-oldest"):
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {POLICIES}")
+        self.capacity = capacity
+        self.policy = policy
+        # key -> (enqueue time, item) when coalescing, else (key, time, item)
+        if policy == "coalesce":
+            self._items = collections.OrderedDict()
+        else:
+            self._items = collections.deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+        self.accepted = 0
+        self.dropped = 0  # Samples lost to drop-oldest or drop-newest
+        self.coalesced = 0  # Samples replaced by a newer one of the same key
+        self.max_depth = 0
+        self.max_wait = 0.0  # Longest time in seconds an item spent queued
+        self.blocked = 0.0  # Total time in seconds callbacks spent blocked
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, key: Hashable, item: Any) -> bool:
+        """Enqueues `item`; returns False if it was refused."""
+        now = time.monotonic()
+        with self._lock:
+            if self._closed:
+                return False
+            if self.policy == "coalesce":
+                if key in self._items:
+                    # Keep the slot's place in line and its original wait
+                    queued_at, _ = self._items[key]
+                    self._items[key] = (queued_at, item)
+                    self.coalesced += 1
+                    self.accepted += 1
+                    return True
+                if len(self._items) >= self.capacity:
+                    self._items.popitem(last=False)
+                    self.dropped += 1
+                self._items[key] = (now, item)
+            else:
+                if len(self._items) >= self.capacity:
+                    if self.policy == "drop-newest":
+                        self.dropped += 1
+                        return False
+                    if self.policy == "drop-oldest":
+                        self._items.popleft()
+                        self.dropped += 1
+                    else:
+                        while len(self._items) >= self.capacity and not self._closed:
+                            self._not_full.wait()
+                        self.blocked += time.monotonic() - now
+                        if self._closed:
+                            return False
+                self._items.append((key, now, item))
+            self.accepted += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[Hashable, Any]]:
+        """Returns the next (key, item), or None on timeout or once closed and
+        drained."""
+        with self._lock:
+            if not self._items and not self._closed:
+                self._not_empty.wait(timeout)
+            if not self._items:
+                return None
+            if self.policy == "coalesce":
+                key, (queued_at, item) = self._items.popitem(last=False)
+            else:
+                key, queued_at, item = self._items.popleft()
+            self.max_wait = max(self.max_wait, time.monotonic() - queued_at)
+            self._not_full.notify()
+            return key, item
+
+    def close(self) -> None:
+        """Wakes blocked producers and lets consumers drain what is left."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "depth": len(self._items),
+                "max_depth": self.max_depth,
+                "accepted": self.accepted,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "max_wait_ms": self.max_wait * 1000,
+                "blocked_ms": self.blocked * 1000,
+            }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (
+            f"{stats['policy']}: depth {stats['depth']}/{self.capacity} "
+            f"(max {stats['max_depth']}), {stats['accepted']} accepted, "
+            f"{stats['dropped']} dropped, {stats['coalesced']} coalesced, "
+            f"max wait {stats['max_wait_ms']:.1f}ms, "
+            f"blocked {stats['blocked_ms']:.1f}ms"
+        )
+
+
+def add_ingest_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--queue-size",
+        dest="queue_size",
+        metavar="N",
+        default=1024,
+        type=int,
+        help="Samples buffered between the zenoh callback and processing.",
+    )
+    parser.add_argument(
+        "--overload",
+        dest="overload",
+        choices=POLICIES,
+        default="drop-oldest",
+        help="What to do with samples when the queue is full.",
+    )
+
+
+def get_ingest_queue_from_args(args) -> IngestQueue:
+    return IngestQueue(capacity=args.queue_size, policy=args.overload)
@@ -0,0 +1,128 @@
+"""Publish-to-receive latency measurement with an HDR-style histogram."""
+
+import csv
+import struct
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import zenoh
+
+SEND_TIME = struct.Struct("<q")  # Wall-clock send time in ns, as an attachment
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+def send_time_attachment() -> bytes:
+    """Attachment embedding the current time, for publishers that want it."""
+    return SEND_TIME.pack(time.time_ns())
+
+
+def sample_latency_us(sample: zenoh.Sample, now_ns: int) -> Optional[int]:
+    """Latency from an embedded send time, falling back to the HLC timestamp.
+
+    Both depend on the publisher's and subscriber's clocks being in sync.
+    """
+    attachment = sample.attachment
+    if attachment is not None:
+        raw = attachment.to_bytes()
+        if len(raw) == SEND_TIME.size:
+            return (now_ns - SEND_TIME.unpack(raw)[0]) // 1000
+    if sample.timestamp is not None:
+        sent_ns = sample.timestamp.get_time_as_ntp64().as_nanos()
+        return (now_ns - sent_ns) // 1000
+    return None
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram of microsecond values, in the style of HdrHistogram.
+
+    Values below 2**(precision_bits + 1) are exact; above that every power of
+    two is split into 2**precision_bits linear buckets, which bounds the
+    relative error to 2**-precision_bits with a fixed, small array.
+    """
+
+    def __init__(self, precision_bits: int = 7, max_value: int = 60_000_000):
+        self.precision_bits = precision_bits
+        self.max_value = max_value
+        self.counts = np.zeros(self._index(max_value) + 1, dtype=np.int64)
+        self.total = 0
+        self.maximum = 0
+        self.negative = 0  # Samples that arrived "before" they were sent
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.precision_bits - 1
+        if shift <= 0:
+            return value
+        return (shift << self.precision_bits) + (value >> shift)
+
+    def upper_value(self, index: int) -> int:
+        sub_buckets = 1 << self.precision_bits
+        if index < 2 * sub_buckets:
+            return index
+        shift = index // sub_buckets - 1
+        mantissa = index - shift * sub_buckets
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        if value < 0:
+            self.negative += 1
+            value = 0
+        self.maximum = max(self.maximum, value)
+        self.counts[self._index(min(value, self.max_value))] += 1
+        self.total += 1
+
+    def percentiles(self, percentiles=PERCENTILES) -> Dict[float, int]:
+        if not self.total:
+            return {}
+        cumulative = np.cumsum(self.counts)
+        ranks = np.ceil(np.asarray(percentiles) / 100.0 * self.total)
+        indices = np.searchsorted(cumulative, ranks)
+        return {
+            p: min(self.upper_value(int(i)), self.maximum)
+            for p, i in zip(percentiles, indices)
+        }
+
+    def summary(self) -> str:
+        values = self.percentiles()
+        parts = [f"p{p:g}={format_us(v)}" for p, v in values.items()]
+        parts.append(f"max={format_us(self.maximum)}")
+        if self.negative:
+            parts.append(f"negative={self.negative}")
+        return "  ".join(parts)
+
+    def reset(self) -> None:
+        self.counts[:] = 0
+        self.total = 0
+        self.maximum = 0
+        self.negative = 0
+
+
+def format_us(value: int) -> str:
+    if value >= 1_000_000:
+        return f"{value / 1_000_000:.2f}s"
+    if value >= 1000:
+        return f"{value / 1000:.2f}ms"
+    return f"{value}us"
+
+
+def write_csv(path: str, histograms: Dict[str, LatencyHistogram]) -> None:
+    """Writes the non-empty buckets of each histogram as a distribution."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "latency_us", "count", "cumulative_fraction"])
+        for name, histogram in histograms.items():
+            if not histogram.total:
+                continue
+            cumulative = 0
+            for index in np.flatnonzero(histogram.counts):
+                count = int(histogram.counts[index])
+                cumulative += count
+                writer.writerow(
+                    [
+                        name,
+                        histogram.upper_value(int(index)),
+                        count,
+                        f"{cumulative / histogram.total:.6f}",
+                    ]
+                )
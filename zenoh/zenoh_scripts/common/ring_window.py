@@ -0,0 +1,89 @@
+"""Preallocated ring-buffer windows with incrementally maintained statistics."""
+
+import math
+
+import numpy as np
+
+
+class RingWindow:
+    """Keeps the last `capacity` values of a stream in a fixed NumPy array.
+
+    The sum is updated on every push and min/max are only recomputed when the
+    current extreme is evicted, so reading the statistics costs O(1) in the
+    common case. Use `reset()` after each emit for tumbling windows, or leave
+    the contents in place for a sliding window over the last `capacity` values.
+    """
+
+    def __init__(self, capacity: int, dtype=np.float64):
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self._values = np.zeros(capacity, dtype=dtype)
+        self._head = 0  # Next write position
+        self.size = 0
+        self.total = 0.0
+        self.overwritten = 0  # Values evicted since the last reset
+        self._minimum = math.inf
+        self._maximum = -math.inf
+        self._extrema_stale = False
+
+    def push(self, values) -> None:
+        values = np.asarray(values, dtype=self._values.dtype).ravel()
+        if len(values) > self.capacity:
+            self.overwritten += len(values) - self.capacity
+            values = values[-self.capacity :]
+        n = len(values)
+        if n == 0:
+            return
+
+        positions = (self._head + np.arange(n)) % self.capacity
+        evicted = max(0, self.size + n - self.capacity)
+        if evicted:
+            # Free slots are filled first, the rest overwrite the oldest values
+            old = self._values[positions[n - evicted :]]
+            self.total -= float(old.sum())
+            self.overwritten += evicted
+            if old.min() <= self._minimum or old.max() >= self._maximum:
+                self._extrema_stale = True
+
+        self._values[positions] = values
+        self._head = (self._head + n) % self.capacity
+        self.size = min(self.capacity, self.size + n)
+        self.total += float(values.sum())
+        self._minimum = min(self._minimum, float(values.min()))
+        self._maximum = max(self._maximum, float(values.max()))
+
+    def _refresh_extrema(self) -> None:
+        if self._extrema_stale:
+            contents = self.values()
+            self._minimum = float(contents.min())
+            self._maximum = float(contents.max())
+            self._extrema_stale = False
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.size if self.size else math.nan
+
+    @property
+    def minimum(self) -> float:
+        self._refresh_extrema()
+        return self._minimum
+
+    @property
+    def maximum(self) -> float:
+        self._refresh_extrema()
+        return self._maximum
+
+    def values(self) -> np.ndarray:
+        """Returns the contents oldest first (a copy)."""
+        start = (self._head - self.size) % self.capacity
+        return np.roll(self._values, -start)[: self.size]
+
+    def reset(self) -> None:
+        self._head = 0
+        self.size = 0
+        self.total = 0.0
+        self.overwritten = 0
+        self._minimum = math.inf
+        self._maximum = -math.inf
+        self._extrema_stale = False
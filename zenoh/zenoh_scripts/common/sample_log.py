@@ -0,0 +1,194 @@
+"""Append-only segmented log of zenoh samples, with a sparse time index.
+
+A recording is a directory of numbered segments. Each segment is a sequence
+of little-endian records:
+
+    time_ns i64 | key_len u16 | encoding_len u16 | payload_len u32 |
+    key utf-8 | encoding utf-8 | payload
+
+`time_ns` is the sample's HLC time when the publisher sets one, otherwise the
+local receive time. Next to every `.seg` file, an `.idx` file holds
+`time_ns i64 | offset u64` entries for the first record and every
+`index_interval`-th record after it, so a replay can start anywhere in a
+recording without scanning it from the beginning. A record cut short by a
+crash ends the segment.
+"""
+
+import bisect
+import mmap
+import struct
+import threading
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional
+
+import zenoh
+
+RECORD_HEADER = struct.Struct("<qHHI")
+INDEX_ENTRY = struct.Struct("<qQ")
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+
+class LoggedSample(NamedTuple):
+    time_ns: int
+    key: str
+    encoding: str
+    payload: bytes
+
+
+def sample_time_ns(sample: zenoh.Sample, now_ns: int) -> int:
+    if sample.timestamp is not None:
+        return sample.timestamp.get_time_as_ntp64().as_nanos()
+    return now_ns
+
+
+def segment_paths(directory: Path) -> List[Path]:
+    return sorted(directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+
+class SegmentWriter:
+    """Appends samples to `directory`, starting a new segment every
+    `segment_size` bytes. Safe to call from several zenoh callback threads.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        segment_size: int = 64 * 1024 * 1024,
+        index_interval: int = 256,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.records = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        existing = segment_paths(self.directory)
+        # Never append to an existing segment, its tail may be torn
+        self._next_number = int(existing[-1].stem) + 1 if existing else 0
+        self._segment = None
+        self._index = None
+
+    def _open_segment(self) -> None:
+        self._close_segment()
+        stem = self.directory / f"{self._next_number:06d}"
+        self._next_number += 1
+        self._segment = open(stem.with_suffix(SEGMENT_SUFFIX), "ab")
+        self._index = open(stem.with_suffix(INDEX_SUFFIX), "ab")
+        self._segment_records = 0
+
+    def _close_segment(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+            self._segment = self._index = None
+
+    def append(self, time_ns: int, key: str, encoding: str, payload: bytes) -> None:
+        key_bytes = key.encode()
+        encoding_bytes = encoding.encode()
+        header = RECORD_HEADER.pack(
+            time_ns, len(key_bytes), len(encoding_bytes), len(payload)
+        )
+        with self._lock:
+            if self._segment is None or self._segment.tell() >= self.segment_size:
+                self._open_segment()
+            offset = self._segment.tell()
+            if self._segment_records % self.index_interval == 0:
+                self._index.write(INDEX_ENTRY.pack(time_ns, offset))
+            self._segment.write(header)
+            self._segment.write(key_bytes)
+            self._segment.write(encoding_bytes)
+            self._segment.write(payload)
+            self._segment_records += 1
+            self.records += 1
+            self.bytes += (
+                RECORD_HEADER.size + len(key_bytes) + len(encoding_bytes) + len(payload)
+            )
+
+    def append_sample(self, sample: zenoh.Sample, now_ns: int) -> None:
+        self.append(
+            sample_time_ns(sample, now_ns),
+            str(sample.key_expr),
+            str(sample.encoding),
+            sample.payload.to_bytes(),
+        )
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._segment is not None:
+                self._segment.flush()
+                self._index.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+
+def read_index(segment: Path) -> List[tuple]:
+    try:
+        data = segment.with_suffix(INDEX_SUFFIX).read_bytes()
+    except FileNotFoundError:
+        return []
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+
+def read_segment(
+    segment: Path, start_ns: Optional[int] = None
+) -> Iterator[LoggedSample]:
+    """Yields the records of a memory-mapped segment, from `start_ns` onwards."""
+    if segment.stat().st_size == 0:
+        return
+    with open(segment, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        offset = 0
+        if start_ns is not None:
+            index = read_index(segment)
+            # Last indexed record at or before `start_ns`, then scan forward
+            position = bisect.bisect_right([time for time, _ in index], start_ns) - 1
+            if position >= 0:
+                offset = index[position][1]
+        end = len(mm)
+        while offset + RECORD_HEADER.size <= end:
+            time_ns, key_len, encoding_len, payload_len = RECORD_HEADER.unpack_from(
+                mm, offset
+            )
+            body = offset + RECORD_HEADER.size
+            next_offset = body + key_len + encoding_len + payload_len
+            if next_offset > end:
+                break  # Torn record
+            offset = next_offset
+            if start_ns is not None and time_ns < start_ns:
+                continue
+            key_end = body + key_len
+            encoding_end = key_end + encoding_len
+            yield LoggedSample(
+                time_ns,
+                mm[body:key_end].decode(),
+                mm[key_end:encoding_end].decode(),
+                mm[encoding_end:next_offset],
+            )
+
+
+def first_time_ns(segment: Path) -> Optional[int]:
+    index = read_index(segment)
+    if index:
+        return index[0][0]
+    return next((record.time_ns for record in read_segment(segment)), None)
+
+
+def read_recording(
+    directory: Path, start_ns: Optional[int] = None
+) -> Iterator[LoggedSample]:
+    """Yields every record of a recording in order, from `start_ns` onwards."""
+    segments = segment_paths(Path(directory))
+    for i, segment in enumerate(segments):
+        if start_ns is not None and i + 1 < len(segments):
+            # Skip whole segments that end before the start time
+            following = first_time_ns(segments[i + 1])
+            if following is not None and following <= start_ns:
+                continue
+        yield from read_segment(segment, start_ns)
@@ -0,0 +1,374 @@
+"""Throughput benchmark over a matrix of payload sizes and publish rates.
+
+For every (size, rate) cell the driver starts one publisher and `--subscribers`
+receivers as separate processes running this same script, and collects what
+each of them achieved:
+
+    python3 z_bench_matrix.py -c ../configs/ultra96/SESSION_CONFIG.json5 \\
+        --output results.json --baseline baseline.json
+
+Results go to a JSON file that a later run can use as `--baseline`; cells whose
+throughput drops, loss grows or CPU use grows by more than `--threshold`
+percent are reported as regressions and make the script exit with status 1.
+"""
+
+import json
+import platform
+import signal
+import struct
+import subprocess
+import sys
+import time
+from typing import List
+
+import zenoh
+
+BENCH_KEY = "bench/thr"
+
+SEQ = struct.Struct("<Q")  # Each message starts with its sequence number
+
+DEFAULT_SIZES = [64, 1024, 16384, 262144, 1048576]
+DEFAULT_RATES = [100.0, 1000.0, 0.0]  # 0 publishes as fast as possible
+
+
+def run_publisher(
+    conf: zenoh.Config, size: int, rate: float, duration: float, settle: float
+):
+    with zenoh.open(conf) as session:
+        pub = session.declare_publisher(BENCH_KEY)
+        while not pub.matching_status.matching:
+            time.sleep(0.05)
+        # Give the remaining subscribers time to be matched as well
+        time.sleep(settle)
+
+        payload = bytearray(max(size, SEQ.size))
+        sent = 0
+        start = time.monotonic()
+        cpu_start = time.process_time()
+        end = start + duration
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                break
+            if rate > 0:
+                # Absolute schedule, so a slow put is caught up on rather than lost
+                due = start + sent / rate
+                if due > now:
+                    time.sleep(due - now)
+            SEQ.pack_into(payload, 0, sent)
+            pub.put(bytes(payload))
+            sent += 1
+        elapsed = time.monotonic() - start
+        cpu = time.process_time() - cpu_start
+
+    report(
+        {
+            "sent": sent,
+            "elapsed": elapsed,
+            "msgs_per_s": sent / elapsed,
+            "bytes_per_s": sent * len(payload) / elapsed,
+            "cpu_percent": 100.0 * cpu / elapsed,
+        }
+    )
+
+
+def run_subscriber(conf: zenoh.Config):
+    received = 0
+    received_bytes = 0
+    first = last = None
+
+    def listener(sample: zenoh.Sample):
+        nonlocal received, received_bytes, first, last
+        last = time.monotonic()
+        if first is None:
+            first = last
+        received += 1
+        received_bytes += len(sample.payload)
+
+    with zenoh.open(conf) as session:
+        session.declare_subscriber(BENCH_KEY, listener)
+        start = time.monotonic()
+        cpu_start = time.process_time()
+        print("READY", flush=True)
+        try:
+            signal.pause()
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.monotonic() - start
+        cpu = time.process_time() - cpu_start
+
+    window = (last - first) if received > 1 else 0.0
+    report(
+        {
+            "received": received,
+            "msgs_per_s": received / window if window else 0.0,
+            "bytes_per_s": received_bytes / window if window else 0.0,
+            "cpu_percent": 100.0 * cpu / elapsed,
+        }
+    )
+
+
+def report(result: dict):
+    print(json.dumps(result), flush=True)
+
+
+def last_json_line(output: str) -> dict:
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_cell(
+    child_argv: List[str],
+    pub_config: List[str],
+    sub_config: List[str],
+    size: int,
+    rate: float,
+    duration: float,
+    subscribers: int,
+    settle: float,
+) -> dict:
+    subs = [
+        subprocess.Popen(
+            child_argv + ["--role", "sub"] + sub_config,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        for _ in range(subscribers)
+    ]
+    for sub in subs:
+        if sub.stdout.readline().strip() != "READY":
+            raise RuntimeError("Subscriber failed to start")
+
+    pub = subprocess.run(
+        child_argv
+        + ["--role", "pub", "--size", str(size), "--rate", str(rate)]
+        + ["--duration", str(duration), "--settle", str(settle)]
+        + pub_config,
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    publisher = last_json_line(pub.stdout)
+
+    # In-flight messages still count as received
+    time.sleep(settle)
+    receivers = []
+    for sub in subs:
+        sub.send_signal(signal.SIGINT)
+        output, _ = sub.communicate()
+        receiver = last_json_line(output)
+        sent = publisher["sent"]
+        receiver["loss_percent"] = (
+            100.0 * max(0, sent - receiver["received"]) / sent if sent else 0.0
+        )
+        receivers.append(receiver)
+
+    return {
+        "size": size,
+        "rate": rate,
+        "publisher": publisher,
+        "subscribers": receivers,
+    }
+
+
+def cell_label(cell: dict) -> str:
+    rate = f"{cell['rate']:g}/s" if cell["rate"] > 0 else "max"
+    return f"{cell['size']:>8} B @ {rate:>7}"
+
+
+def print_cell(cell: dict):
+    publisher = cell["publisher"]
+    print(
+        f"{cell_label(cell)}  pub {publisher['msgs_per_s']:10.1f} msgs/s"
+        f"  cpu {publisher['cpu_percent']:5.1f}%"
+    )
+    for i, receiver in enumerate(cell["subscribers"]):
+        print(
+            f"{'':22}sub{i} {receiver['msgs_per_s']:10.1f} msgs/s"
+            f"  {receiver['bytes_per_s'] / 1e6:8.2f} MB/s"
+            f"  loss {receiver['loss_percent']:5.1f}%  cpu {receiver['cpu_percent']:5.1f}%"
+        )
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Returns one message per regressed metric of the cells found in both files."""
+    previous = {(c["size"], c["rate"]): c for c in baseline["cells"]}
+    regressions = []
+    for cell in results["cells"]:
+        old = previous.get((cell["size"], cell["rate"]))
+        if old is None:
+            continue
+        label = cell_label(cell)
+        pairs = [("pub", cell["publisher"], old["publisher"])] + [
+            (f"sub{i}", new, prev)
+            for i, (new, prev) in enumerate(
+                zip(cell["subscribers"], old["subscribers"])
+            )
+        ]
+        for role, new, prev in pairs:
+            if new["msgs_per_s"] < prev["msgs_per_s"] * (1 - threshold / 100):
+                regressions.append(
+                    f"{label} {role}: {prev['msgs_per_s']:.1f} -> {new['msgs_per_s']:.1f} msgs/s"
+                )
+            # Ignore sub-point changes that are noise on mostly idle processes
+            cpu_limit = max(
+                prev["cpu_percent"] * (1 + threshold / 100), prev["cpu_percent"] + 1.0
+            )
+            if new["cpu_percent"] > cpu_limit:
+                regressions.append(
+                    f"{label} {role}: cpu {prev['cpu_percent']:.1f}% -> {new['cpu_percent']:.1f}%"
+                )
+            # Loss is already a percentage, so compare it in absolute points
+            if new.get("loss_percent", 0.0) > prev.get("loss_percent", 0.0) + threshold:
+                regressions.append(
+                    f"{label} {role}: loss {prev['loss_percent']:.1f}% -> {new['loss_percent']:.1f}%"
+                )
+    return regressions
+
+
+def config_argv(args) -> List[str]:
+    """Re-serializes the zenoh config arguments for the child processes."""
+    argv = []
+    if args.mode is not None:
+        argv += ["--mode", args.mode]
+    for endpoint in args.connect or []:
+        argv += ["--connect", endpoint]
+    for endpoint in args.listen or []:
+        argv += ["--listen", endpoint]
+    if args.config is not None:
+        argv += ["--config", args.config]
+    if args.no_multicast_scouting:
+        argv.append("--no-multicast-scouting")
+    for cfg in args.cfg:
+        argv.append(f"--cfg={cfg}")
+    return argv
+
+
+def main(args):
+    if args.compare is not None:
+        with open(args.compare) as f:
+            results = json.load(f)
+        for cell in results["cells"]:
+            print_cell(cell)
+    else:
+        child_argv = [sys.executable, "-u", __file__]
+        if args.loopback is not None:
+            # The publisher listens and every subscriber connects to it directly
+            local = ["--mode", "peer", "--no-multicast-scouting"]
+            pub_config = local + ["--listen", args.loopback]
+            sub_config = local + ["--connect", args.loopback]
+        else:
+            pub_config = sub_config = config_argv(args)
+
+        cells = []
+        for size in args.sizes or DEFAULT_SIZES:
+            for rate in args.rates or DEFAULT_RATES:
+                cell = run_cell(
+                    child_argv,
+                    pub_config,
+                    sub_config,
+                    size,
+                    rate,
+                    args.duration,
+                    args.subscribers,
+                    args.settle,
+                )
+                print_cell(cell)
+                cells.append(cell)
+
+        results = {
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "duration": args.duration,
+            "subscribers": args.subscribers,
+            "cells": cells,
+        }
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(prog="z_bench_matrix")
+    common.add_config_arguments(parser)
+    parser.add_argument(
+        "--size",
+        "-s",
+        dest="sizes",
+        action="append",
+        type=int,
+        help=f"Payload size in bytes, may be repeated (default: {DEFAULT_SIZES}).",
+    )
+    parser.add_argument(
+        "--rate",
+        "-r",
+        dest="rates",
+        action="append",
+        type=float,
+        help=f"Target msgs/s, 0 for unthrottled, may be repeated (default: {DEFAULT_RATES}).",
+    )
+    parser.add_argument(
+        "--duration", "-d", default=5.0, type=float, help="Seconds per cell."
+    )
+    parser.add_argument(
+        "--subscribers", default=1, type=int, help="Receiver processes per cell."
+    )
+    parser.add_argument(
+        "--settle",
+        default=0.5,
+        type=float,
+        help="Seconds to wait for discovery before, and in-flight data after, each cell.",
+    )
+    parser.add_argument(
+        "--loopback",
+        metavar="ENDPOINT",
+        type=str,
+        help="Connect the subscribers straight to a publisher listening on "
+        "ENDPOINT (e.g. tcp/127.0.0.1:7449). Other config arguments are ignored.",
+    )
+    parser.add_argument("--output", "-o", type=str, help="Write the results JSON here.")
+    parser.add_argument(
+        "--baseline", "-b", type=str, help="Flag regressions against this results JSON."
+    )
+    parser.add_argument(
+        "--threshold",
+        default=10.0,
+        type=float,
+        help="Tolerated change in percent (percentage points for loss).",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="RESULTS",
+        type=str,
+        help="Compare an existing results JSON against --baseline instead of running.",
+    )
+    parser.add_argument("--role", choices=["pub", "sub"], help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    if args.role is None:
+        main(args)
+    else:
+        conf = common.get_config_from_args(args)
+        if args.role == "pub":
+            size = args.sizes[0] if args.sizes else DEFAULT_SIZES[0]
+            rate = args.rates[0] if args.rates else DEFAULT_RATES[0]
+            run_publisher(conf, size, rate, args.duration, args.settle)
+        else:
+            run_subscriber(conf)
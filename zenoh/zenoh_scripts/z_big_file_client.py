@@ -1,16 +1,41 @@
 import time
 import hashlib
+import json
 import zenoh
 import argparse
+import filecmp
+import mimetypes
 import os
 import ctypes
 import platform
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from common import compression
+from common.common import normalize_parameters
 
 SAVE_FOLDER = "received_images"
+CACHE_FOLDER = os.path.join(SAVE_FOLDER, "cache")
+CACHE_SIZE = 256 * 1024 * 1024
+RANGE_SIZE = 256 * 1024
+WRITE_BUFFER = 1024 * 1024
+# Variant `fmt` parameter -> file extension
+VARIANT_EXTENSIONS = {"jpeg": ".jpg", "jpg": ".jpg", "webp": ".webp", "png": ".png"}
 if not os.path.exists(SAVE_FOLDER):
     os.makedirs(SAVE_FOLDER)
 
 
+def default_file_mode() -> int:
+    """The mode `open()` gives new files under the current umask."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
 def format_bytes(size):
     for unit in ["B", "KB", "MB", "GB"]:
         if size < 1024.0:
@@ -41,38 +66,523 @@ def set_wallpaper(image_path):
         print(f"❌ Failed to set wallpaper: {e}")
 
 
-def main(conf: zenoh.Config, selector: str, target: zenoh.QueryTarget, timeout: float):
+def is_image(path: str) -> bool:
+    mime = mimetypes.guess_type(path)[0]
+    return mime is not None and mime.startswith("image/")
+
+
+def variant_parameters(parameters: zenoh.Parameters) -> Dict[str, str]:
+    """The `w`, `q` and `fmt` parameters that ask for an image variant."""
+    variant = {}
+    for name in ("w", "q", "fmt"):
+        value = parameters.get(name)
+        if value is not None:
+            variant[name] = value.lower()
+    return variant
+
+
+def output_path(key_expr: zenoh.KeyExpr, prefix: str, variant: Dict[str, str]) -> str:
+    """`<prefix>/photos/cat.jpg` is saved as `SAVE_FOLDER/photos/cat.jpg`, and
+    its variant `?w=100&fmt=webp` as `SAVE_FOLDER/photos/cat.w100.webp`."""
+    name = str(key_expr)
+    if name.startswith(prefix + "/"):
+        name = name[len(prefix) + 1 :]
+    parts = name.split("/")
+    if any(part in ("", ".", "..") or "*" in part for part in parts):
+        raise ValueError(f"'{key_expr}' does not name a single asset")
+    path = os.path.join(SAVE_FOLDER, *parts)
+    if not variant:
+        return path
+    tags = ""
+    for tag in ("w", "q"):
+        if tag in variant:
+            if not variant[tag].isdigit():
+                raise ValueError(f"Invalid variant parameter {tag}={variant[tag]}")
+            tags += f".{tag}{variant[tag]}"
+    # The queryable encodes variants as JPEG unless told otherwise
+    extension = VARIANT_EXTENSIONS.get(variant.get("fmt", "jpeg"))
+    if extension is None:
+        raise ValueError(f"Unknown variant format {variant['fmt']!r}")
+    return os.path.splitext(path)[0] + tags + extension
+
+
+def copy_atomic(src_path: str, dst_path: str):
+    """Copies through a temporary file, so `dst_path` is never seen half-written."""
+    tmp_path = dst_path + ".tmp"
+    shutil.copy2(src_path, tmp_path)
+    os.replace(tmp_path, dst_path)
+
+
+class Download:
+    """Receives a file into a temporary file next to `full_path`, and only
+    moves it into place once its SHA-256 matches.
+
+    Data goes through a buffered writer into preallocated space, and is hashed
+    as it is written while it arrives in order; only out of order data makes
+    `finish` re-read the file to hash it.
+    """
+
+    def __init__(self, full_path: str, size: int):
+        self.full_path = full_path
+        self.size = size
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(full_path) or ".", prefix=".download-"
+        )
+        # mkstemp creates the file as 0600, and os.replace would keep that
+        os.chmod(self.tmp_path, default_file_mode())
+        self.file = os.fdopen(fd, "wb", buffering=WRITE_BUFFER)
+        if size > 0 and hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            self.file.truncate(size)
+        self._hash = hashlib.sha256()
+        self._hashed = 0  # Bytes hashed so far, all in order from the start
+        self._in_order = True
+
+    def write(self, offset: int, data: bytes):
+        if self.file.tell() != offset:
+            self.file.seek(offset)
+        self.file.write(data)
+        if self._in_order and offset == self._hashed:
+            self._hash.update(data)
+            self._hashed += len(data)
+        else:
+            self._in_order = False
+
+    def finish(self, expected_hash: Optional[str]) -> Optional[str]:
+        """Verifies and publishes the file; returns its hash, or None on a
+        mismatch."""
+        self.file.close()
+        if not (self._in_order and self._hashed == self.size):
+            self._hash = hashlib.sha256()
+            with open(self.tmp_path, "rb") as f:
+                while block := f.read(WRITE_BUFFER):
+                    self._hash.update(block)
+        file_hash = self._hash.hexdigest()
+        if expected_hash is not None and file_hash != expected_hash:
+            print(f"Hash mismatch: expected {expected_hash}, got {file_hash}")
+            self.abort()
+            return None
+        os.replace(self.tmp_path, self.full_path)
+        return file_hash
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class ContentCache:
+    """Content-addressed store of received files, keyed by SHA-256.
+
+    `index.json` remembers the hash last received for each key expression so
+    it can be sent as `if_none_match`. The least recently used files are
+    evicted once the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, "index.json")
+        self._index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self._index = json.load(f)
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256)
+
+    def known_hash(self, key: str) -> Optional[str]:
+        sha256 = self._index.get(key)
+        if sha256 is None or not os.path.exists(self.path_for(sha256)):
+            return None
+        return sha256
+
+    def get(self, sha256: str) -> Optional[str]:
+        path = self.path_for(sha256)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # Mark as recently used
+        return path
+
+    def add(self, key: str, sha256: str, src_path: str):
+        path = self.path_for(sha256)
+        if not os.path.exists(path):
+            copy_atomic(src_path, path)
+        os.utime(path)
+        self._index[key] = sha256
+        self._evict(keep=sha256)
+        with open(self.index_path + ".tmp", "w") as f:
+            json.dump(self._index, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def _evict(self, keep: str):
+        entries = []
+        for name in os.listdir(self.directory):
+            if len(name) != 64:  # Only SHA-256 named files
+                continue
+            st = os.stat(self.path_for(name))
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            os.remove(self.path_for(name))
+            total -= size
+            print(f">> [Cache] Evicted {name} ({format_bytes(size)})")
+        self._index = {
+            key: sha256
+            for key, sha256 in self._index.items()
+            if os.path.exists(self.path_for(sha256))
+        }
+
+
+def reply_header(sample: zenoh.Sample) -> dict:
+    if sample.attachment is None:
+        return {}
+    return json.loads(sample.attachment.to_string())
+
+
+def reply_data(sample: zenoh.Sample, header: dict) -> bytes:
+    """The reply's payload, decompressed if the server compressed it."""
+    return compression.decompress(header.get("compression"), sample.payload.to_bytes())
+
+
+def publish_cached(cache: ContentCache, sha256: str, full_path: str):
+    """Restores a cached file to `full_path` unless it already holds it."""
+    cached_path = cache.get(sha256)
+    if os.path.exists(full_path) and filecmp.cmp(cached_path, full_path):
+        print(f"Already up to date ({sha256})")
+        return
+    copy_atomic(cached_path, full_path)
+    if is_image(full_path):
+        set_wallpaper(full_path)
+
+
+def receive_chunks(replies, full_path) -> Optional[dict]:
+    """Streams chunked replies to disk as they arrive.
+
+    Returns the header of the last reply once the file is verified and in
+    place at `full_path`, or None if nothing usable was received. A "not
+    modified" reply is returned without touching the file.
+    """
+    header = None
+    received = 0
+    download = None
+    try:
+        for reply in replies:
+            if not reply.ok:
+                print(f"REPLY NOT OK")
+                continue
+            header = reply_header(reply.ok)
+            if header.get("not_modified"):
+                return header
+            chunk = reply_data(reply.ok, header)
+            # Empty files come back as a single reply without chunk fields
+            header.setdefault("size", len(chunk))
+            header.setdefault("offset", 0)
+            header.setdefault("index", 0)
+            header.setdefault("count", 1)
+            if download is None:
+                download = Download(full_path, header["size"])
+            download.write(header["offset"], chunk)
+            received += 1
+            print(
+                f"Chunk {header['index'] + 1}/{header['count']} "
+                f"({format_bytes(header['offset'] + len(chunk))} of {format_bytes(header['size'])})"
+            )
+        if header is None or received != header["count"]:
+            print(f"Incomplete transfer: {received} chunks received")
+            return None
+        if download.finish(header.get("sha256")) is None:
+            return None
+        download = None
+        return header
+    finally:
+        if download is not None:
+            download.abort()
+
+
+def extend_parameters(parameters: zenoh.Parameters, **extra) -> zenoh.Parameters:
+    result = zenoh.Parameters(str(parameters))
+    for key, value in extra.items():
+        result.insert(key, str(value))
+    return result
+
+
+def fetch_metadata(querier: zenoh.Querier, parameters: zenoh.Parameters):
+    for reply in querier.get(parameters=extend_parameters(parameters, meta="true")):
+        if reply.ok:
+            return json.loads(reply.ok.payload.to_string())
+        print(f"REPLY NOT OK: {reply.err.payload.to_string()}")
+    return None
+
+
+def fetch_range(
+    querier: zenoh.Querier,
+    parameters: zenoh.Parameters,
+    offset: int,
+    length: int,
+    expected_hash: str,
+) -> bytes:
+    range_parameters = extend_parameters(parameters, offset=offset, len=length)
+    for reply in querier.get(parameters=range_parameters):
+        if not reply.ok:
+            print(f"REPLY NOT OK: {reply.err.payload.to_string()}")
+            continue
+        header = reply_header(reply.ok)
+        if "offset" not in header:
+            raise RuntimeError("reply is missing its range header")
+        if header.get("sha256") != expected_hash:
+            raise RuntimeError("file changed on the server")
+        data = reply_data(reply.ok, header)
+        if header["offset"] == offset and len(data) == min(
+            length, header["size"] - offset
+        ):
+            return data
+    raise RuntimeError("no valid reply")
+
+
+def download_ranges(
+    querier: zenoh.Querier,
+    parameters: zenoh.Parameters,
+    full_path: str,
+    metadata: dict,
+    parallel: int,
+    range_size: int,
+    retries: int,
+) -> Optional[str]:
+    """Downloads the file as concurrent byte ranges, resuming a previous attempt.
+
+    Ranges are written into a `.part` file and recorded in a JSON sidecar, so an
+    interrupted download only fetches the missing ranges when run again.
+    Returns the verified SHA-256, or None if the download is incomplete.
+    """
+    size = metadata["size"]
+    expected_hash = metadata["sha256"]
+
+    part_path = full_path + ".part"
+    progress_path = part_path + ".json"
+    done = set()
+    if os.path.exists(part_path) and os.path.exists(progress_path):
+        with open(progress_path) as f:
+            progress = json.load(f)
+        if progress["sha256"] == expected_hash and progress["range_size"] == range_size:
+            done = set(progress["done"])
+            print(f"Resuming download: {len(done)} ranges already on disk")
+
+    offsets = [offset for offset in range(0, size, range_size) if offset not in done]
+    print(
+        f"Fetching {len(offsets)} ranges of {format_bytes(range_size)} "
+        f"({format_bytes(size)} total) with {parallel} workers..."
+    )
+    lock = threading.Lock()
+
+    def save_progress():
+        progress = {"sha256": expected_hash, "range_size": range_size}
+        progress["done"] = sorted(done)
+        with open(progress_path + ".tmp", "w") as f:
+            json.dump(progress, f)
+        os.replace(progress_path + ".tmp", progress_path)
+
+    with open(part_path, "r+b" if os.path.exists(part_path) else "w+b") as part:
+        part.truncate(size)
+
+        def fetch(offset: int) -> bool:
+            for attempt in range(1, retries + 1):
+                try:
+                    data = fetch_range(
+                        querier, parameters, offset, range_size, expected_hash
+                    )
+                    break
+                except RuntimeError as e:
+                    print(f"Range {offset} failed ({attempt}/{retries}): {e}")
+            else:
+                return False
+            with lock:
+                part.seek(offset)
+                part.write(data)
+                part.flush()
+                done.add(offset)
+                save_progress()
+            return True
+
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            results = list(pool.map(fetch, offsets))
+
+    failed = results.count(False)
+    if failed:
+        print(f"{failed} ranges failed, run again to resume")
+        return None
+
+    sha256_hash = hashlib.sha256()
+    with open(part_path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            sha256_hash.update(block)
+    os.remove(progress_path)
+    if sha256_hash.hexdigest() != expected_hash:
+        print(f"Hash mismatch: expected {expected_hash}, got {sha256_hash.hexdigest()}")
+        os.remove(part_path)
+        return None
+    os.replace(part_path, full_path)
+    return expected_hash
+
+
+def main(
+    conf: zenoh.Config,
+    selector: str,
+    target: zenoh.QueryTarget,
+    timeout: float,
+    stream: bool,
+    parallel: Optional[int],
+    range_size: int,
+    retries: int,
+    cache_size: Optional[int],
+    compress: Optional[str],
+    changes_key: Optional[str],
+    prefix: str,
+):
     zenoh.init_log_from_env_or("error")
     print(f"Current Config: {conf}")
 
+    cache = ContentCache(CACHE_FOLDER, cache_size) if cache_size else None
+
     with zenoh.open(conf) as session:
         query_selector = zenoh.Selector(selector)
+        # Chunks share one key, so consolidation would keep only the last one
         querier = session.declare_querier(
-            query_selector.key_expr, target=target, timeout=timeout
+            query_selector.key_expr,
+            target=target,
+            consolidation=zenoh.ConsolidationMode.NONE,
+            timeout=timeout,
         )
 
-        sha256_hash = hashlib.sha256()
-        print(f"Requesting image via Zenoh...")
-        replies = querier.get(
-            encoding=zenoh.Encoding.TEXT_JSON5, parameters=query_selector.parameters
-        )
-        for reply in replies:
-            if reply.ok:
-                print(f"REPLY OK")
-                received_data = reply.ok.payload.to_bytes()
-                sha256_hash.update(received_data)
-                file_hash = sha256_hash.hexdigest()
-                print(f"Received file_hash {file_hash}")
-                filename = "wallpaper_update.jpg"
-                full_path = os.path.join(SAVE_FOLDER, filename)
-
-                with open(full_path, "wb") as f:
-                    f.write(received_data)
-
-                # Change the wallpaper
+        selector_parameters = normalize_parameters(query_selector.parameters)
+        variant = variant_parameters(selector_parameters)
+        full_path = output_path(query_selector.key_expr, prefix, variant)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Variants are cached apart from the original they are rendered from
+        cache_key = str(query_selector.key_expr)
+        if variant:
+            cache_key += "?" + ";".join(f"{k}={v}" for k, v in variant.items())
+
+        def on_received(file_hash: str):
+            print(f"Received file_hash {file_hash}")
+            if cache:
+                cache.add(cache_key, file_hash, full_path)
+            # Only images make a wallpaper, other assets are just saved
+            if is_image(full_path):
                 set_wallpaper(full_path)
-            else:
-                print(f"REPLY NOT OK")
+
+        def fetch() -> Optional[str]:
+            """Downloads the file unless the cache already holds it; returns
+            the hash now in place, or None if the download failed."""
+            parameters = zenoh.Parameters(str(selector_parameters))
+            if stream:
+                parameters.insert("stream", "true")
+            if compress:
+                parameters.insert("compress", compress)
+
+            known_hash = cache.known_hash(cache_key) if cache else None
+            if known_hash is not None:
+                print(f"Cached file_hash {known_hash}")
+
+            if parallel:
+                metadata = fetch_metadata(querier, parameters)
+                if metadata is None:
+                    print("No metadata received")
+                    return None
+                if metadata["sha256"] == known_hash:
+                    print(f"NOT MODIFIED")
+                    publish_cached(cache, known_hash, full_path)
+                    return known_hash
+                file_hash = download_ranges(
+                    querier,
+                    parameters,
+                    full_path,
+                    metadata,
+                    parallel,
+                    range_size,
+                    retries,
+                )
+                if file_hash is not None:
+                    on_received(file_hash)
+                return file_hash
+
+            if known_hash is not None:
+                parameters.insert("if_none_match", known_hash)
+
+            print(f"Requesting image via Zenoh...")
+            replies = querier.get(parameters=parameters)
+
+            if stream:
+                header = receive_chunks(replies, full_path)
+                if header is None:
+                    return None
+                if header.get("not_modified"):
+                    print(f"NOT MODIFIED")
+                    publish_cached(cache, known_hash, full_path)
+                    return known_hash
+                on_received(header["sha256"])
+                return header["sha256"]
+
+            file_hash = None
+            for reply in replies:
+                if reply.ok:
+                    header = reply_header(reply.ok)
+                    if header.get("not_modified"):
+                        print(f"NOT MODIFIED")
+                        publish_cached(cache, known_hash, full_path)
+                        file_hash = known_hash
+                        continue
+                    print(f"REPLY OK")
+                    received_data = reply_data(reply.ok, header)
+                    download = Download(full_path, len(received_data))
+                    download.write(0, received_data)
+                    file_hash = download.finish(header.get("sha256"))
+                    if file_hash is None:
+                        continue
+
+                    # Change the wallpaper
+                    on_received(file_hash)
+                else:
+                    print(f"REPLY NOT OK")
+            return file_hash
+
+        if changes_key is None:
+            fetch()
+            return
+
+        # Watch mode: fetch once, then again only when the server announces
+        # new content for our key, instead of polling
+        changes = queue.SimpleQueue()
+
+        def on_change(sample: zenoh.Sample):
+            change = json.loads(sample.payload.to_string())
+            if query_selector.key_expr.intersects(zenoh.KeyExpr(change["key"])):
+                changes.put(change)
+
+        subscriber = session.declare_subscriber(changes_key, on_change)
+        current_hash = fetch()
+        print(f"Watching '{changes_key}' for changes. Press CTRL-C to quit...")
+        try:
+            while True:
+                change = changes.get()
+                while not changes.empty():
+                    change = changes.get()  # Only the latest state matters
+                print(
+                    f">> [Changes] {change['key']}: {change.get('sha256', 'deleted')}"
+                )
+                if change.get("deleted") or change.get("sha256") == current_hash:
+                    continue
+                current_hash = fetch() or current_hash
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+        finally:
+            subscriber.undeclare()
 
 
 if __name__ == "__main__":
@@ -80,11 +590,80 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     common.add_config_arguments(parser)
-    parser.add_argument("--selector", "-s", default="BIG/**", type=str)
+    parser.add_argument("--selector", "-s", default="BIG/crying_cat.jpg", type=str)
+    parser.add_argument(
+        "--stream",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help="Request the file as a stream of indexed chunks, written to disk "
+        "as they arrive (--no-stream: one reply holding the whole file).",
+    )
+    parser.add_argument(
+        "--parallel",
+        "-p",
+        type=int,
+        help="Download as byte ranges with this many concurrent requests, resuming any earlier attempt.",
+    )
+    parser.add_argument(
+        "--range-size",
+        type=int,
+        default=RANGE_SIZE,
+        help="Size of each byte range in bytes.",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="Attempts per byte range before giving up.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE,
+        help="Byte budget of the local content cache, 0 disables it.",
+    )
+    parser.add_argument(
+        "--compress",
+        type=str,
+        help="Codecs to accept in order of preference, e.g. 'zstd,zlib'; "
+        f"available here: {','.join(compression.available_codecs())}.",
+    )
+    parser.add_argument(
+        "--watch",
+        nargs="?",
+        const="BIG/@changes",
+        dest="changes_key",
+        help="Keep running and fetch again whenever the queryable announces a "
+        "change on this key (default: BIG/@changes).",
+    )
+    parser.add_argument(
+        "--prefix",
+        default="BIG",
+        type=str,
+        help="Key prefix of the queryable's assets; the rest of the key is the "
+        f"file's path under {SAVE_FOLDER}.",
+    )
     args = parser.parse_args()
+    try:
+        selector = zenoh.Selector(args.selector)
+        output_path(
+            selector.key_expr,
+            args.prefix,
+            variant_parameters(normalize_parameters(selector.parameters)),
+        )
+    except ValueError as e:
+        parser.error(str(e))
     main(
         common.get_config_from_args(args),
         args.selector,
         zenoh.QueryTarget.ALL,
         30.0,
+        args.stream,
+        args.parallel,
+        args.range_size,
+        args.retries,
+        args.cache_size,
+        args.compress,
+        args.changes_key,
+        args.prefix,
     )
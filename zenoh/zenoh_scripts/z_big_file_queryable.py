@@ -1,59 +1,722 @@
 import time
+import collections
+import contextlib
 import hashlib
+import io
+import json
+import mimetypes
+import mmap
+import re
+import threading
 import zenoh
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
-CHUNK_SIZE = 20 * 1024  # 128KB chunks
+from common import compression
+from common.common import query_parameters
+from common.dir_watcher import DirectoryWatcher
+
+CHUNK_SIZE = 20 * 1024  # 20KB chunks
+MAX_CHUNK_SIZE = 4 * 1024 * 1024  # Larger `chunk` requests are clamped
+MAX_CACHED_PAYLOAD = 64 * 1024 * 1024  # Larger files are served from an mmap
+ASSET_CACHE_SIZE = 128 * 1024 * 1024  # Byte budget of file contents in memory
+VARIANT_CACHE_SIZE = 32 * 1024 * 1024  # Byte budget of rendered image variants
+VARIANT_WORKERS = 2
+# `fmt` parameter -> Pillow format name
+VARIANT_FORMATS = {"jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP", "png": "PNG"}
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(SCRIPT_DIR, "..", "test_image", "crying_cat.jpg")
+ASSET_DIR = os.path.join(SCRIPT_DIR, "..", "test_image")
+
+
+class FileEntry:
+    """Size, mtime, SHA-256, media type and (when small enough) the contents
+    of a file."""
+
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        mtime_ns: int,
+        sha256: str,
+        payload: Optional[bytes],
+        mime: str = "application/octet-stream",
+    ):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+        self.payload = payload
+        self.mime = mime
+
+    @property
+    def encoding(self) -> zenoh.Encoding:
+        return zenoh.Encoding(self.mime)
+
+
+class FileCache:
+    """Caches file metadata until the file's mtime or size changes, and the
+    contents of recently served files within a byte budget.
+
+    A hit costs one `os.stat`; a file is only re-hashed when the stat no
+    longer matches the cached entry, and only re-read when its contents were
+    evicted. The least recently served contents are evicted first, and files
+    larger than `max_payload_size` are never held, only served from an mmap.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = ASSET_CACHE_SIZE,
+        max_payload_size: int = MAX_CACHED_PAYLOAD,
+    ):
+        self.max_bytes = max_bytes
+        self.max_payload_size = max_payload_size
+        self.size = 0  # Bytes of contents held
+        self.hits = 0  # Contents served from memory
+        self.misses = 0  # Contents read from disk
+        self._entries: Dict[str, FileEntry] = {}
+        # Paths whose entry holds its contents, least recently served first
+        self._held: "collections.OrderedDict[str, int]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, load: bool = True) -> Optional[FileEntry]:
+        """Returns the entry of `path`; with `load`, keeps its contents in
+        memory if they fit the budget. Use `load=False` for metadata only."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(path)
+            return None
+
+        keep = load and st.st_size <= min(self.max_payload_size, self.max_bytes)
+        with self._lock:
+            entry = self._entries.get(path)
+            if (
+                entry is not None
+                and entry.size == st.st_size
+                and entry.mtime_ns == st.st_mtime_ns
+                and (entry.payload is not None or not keep)
+            ):
+                if entry.payload is not None and load:
+                    self.hits += 1
+                    self._held.move_to_end(path)
+                elif load:
+                    self.misses += 1
+                return entry
+
+        entry = self._load(path, st, keep)
+        with self._lock:
+            self._forget(path)
+            self._entries[path] = entry
+            if load:
+                self.misses += 1
+            if entry.payload is not None:
+                self._held[path] = entry.size
+                self.size += entry.size
+                self._evict()
+        return entry
+
+    def _load(self, path: str, st: os.stat_result, keep: bool) -> FileEntry:
+        print(f">> [Cache] Loading {path}")
+        with open(path, "rb") as f:
+            if keep:
+                payload = f.read()
+                file_hash = hashlib.sha256(payload).hexdigest()
+            else:
+                payload = None
+                if st.st_size == 0:
+                    file_hash = hashlib.sha256().hexdigest()
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        file_hash = hashlib.sha256(mm).hexdigest()
+        mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        return FileEntry(path, st.st_size, st.st_mtime_ns, file_hash, payload, mime)
+
+    def _forget(self, path: str):
+        self._entries.pop(path, None)
+        if path in self._held:
+            self.size -= self._held.pop(path)
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            path, size = self._held.popitem(last=False)
+            self.size -= size
+            # Replace rather than mutate: replies in flight keep their payload
+            e = self._entries[path]
+            self._entries[path] = FileEntry(
+                e.path, e.size, e.mtime_ns, e.sha256, None, e.mime
+            )
+            print(f">> [Cache] Evicted {path} ({size} bytes)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "held": len(self._held),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+file_cache = FileCache()
+
+VariantKey = Tuple[str, Optional[int], int, str]  # source sha256, w, q, fmt
+
+
+class VariantCache:
+    """LRU of rendered image variants, bounded by the bytes it holds.
+
+    Each variant is rendered at most once: concurrent requests for a variant
+    that is still rendering share the same future instead of starting another
+    render.
+    """
+
+    def __init__(self, max_bytes: int, workers: int = VARIANT_WORKERS):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "collections.OrderedDict[VariantKey, FileEntry]" = (
+            collections.OrderedDict()
+        )
+        self._rendering: Dict[VariantKey, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="variant")
+
+    def get(self, source: FileEntry, width: Optional[int], quality: int, fmt: str):
+        """Returns a future of the variant's `FileEntry`."""
+        key = (source.sha256, width, quality, fmt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(entry)
+                return future
+            future = self._rendering.get(key)
+            if future is None:
+                self.misses += 1
+                future = self._rendering[key] = self._pool.submit(
+                    self._render, key, source
+                )
+            return future
+
+    def _render(self, key: VariantKey, source: FileEntry) -> FileEntry:
+        _, width, quality, fmt = key
+        try:
+            start_time = time.time()
+            payload = render_variant(read_payload(source), width, quality, fmt)
+            entry = FileEntry(
+                source.path,
+                len(payload),
+                source.mtime_ns,
+                hashlib.sha256(payload).hexdigest(),
+                payload,
+                f"image/{VARIANT_FORMATS[fmt].lower()}",
+            )
+            print(
+                f">> [Variant] Rendered w={width} q={quality} fmt={fmt}: "
+                f"{source.size} -> {entry.size} bytes in {time.time() - start_time:.3f}s"
+            )
+        except BaseException:
+            with self._lock:
+                del self._rendering[key]
+            raise
+        with self._lock:
+            del self._rendering[key]
+            if entry.size <= self.max_bytes:
+                self._entries[key] = entry
+                self.size += entry.size
+                while self.size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= evicted.size
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "held": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
 
 
-def query_handler(query: zenoh.Query):
-    print(SCRIPT_DIR)
-    print(f">> [Queryable ] Received Query '{query.selector}'")
-    if not os.path.exists(file_path):
-        print(f"No such file exists on {file_path}")
-        query.reply(query.key_expr, b"", encoding=zenoh.Encoding.TEXT_JSON5)
+def render_variant(data: bytes, width: Optional[int], quality: int, fmt: str) -> bytes:
+    """Re-encodes an image, shrunk to at most `width` pixels wide."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ValueError("Image variants require Pillow (pip install pillow)")
+
+    with Image.open(io.BytesIO(data)) as image:
+        if width is not None and width < image.width:
+            # thumbnail() keeps the aspect ratio and lets JPEG decode at a
+            # reduced scale instead of decoding the full image first
+            image.thumbnail((width, image.height))
+        if VARIANT_FORMATS[fmt] == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, VARIANT_FORMATS[fmt], quality=quality)
+        return out.getvalue()
+
+
+def parse_variant(
+    parameters: zenoh.Parameters,
+) -> Optional[Tuple[Optional[int], int, str]]:
+    """`?w=..&q=..&fmt=..` -> (width, quality, fmt), or None for the original.
+
+    Raises ValueError for out of range parameters.
+    """
+    width, quality, fmt = (parameters.get(name) for name in ("w", "q", "fmt"))
+    if width is None and quality is None and fmt is None:
+        return None
+    width = int(width) if width is not None else None
+    quality = int(quality) if quality is not None else 85
+    fmt = (fmt or "jpeg").lower()
+    if width is not None and width <= 0:
+        raise ValueError(f"Invalid width {width}")
+    if not 1 <= quality <= 100:
+        raise ValueError(f"Invalid quality {quality}")
+    if fmt not in VARIANT_FORMATS:
+        raise ValueError(
+            f"Unknown format {fmt!r}, expected one of {list(VARIANT_FORMATS)}"
+        )
+    return width, quality, fmt
+
+
+variant_cache = VariantCache(VARIANT_CACHE_SIZE)
+
+
+def is_asset_name(name: str) -> bool:
+    """Hidden files and names that are not plain key chunks are not served."""
+    return not any(
+        part.startswith((".", "@")) or re.search(r"[*$?#]", part) or not part
+        for part in name.split("/")
+    )
+
+
+def list_assets(directory: str) -> Dict[str, str]:
+    """Relative names, '/'-separated, to the paths of all servable files."""
+    assets = {}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if is_asset_name(d)]
+        for filename in files:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, directory).replace(os.sep, "/")
+            if is_asset_name(name):
+                assets[name] = path
+    return assets
+
+
+def resolve_assets(
+    directory: str, prefix: str, key_expr: zenoh.KeyExpr
+) -> List[Tuple[str, str]]:
+    """(key, path) of the assets a query's key expression refers to."""
+    key = str(key_expr)
+    if "*" not in key and "$" not in key:
+        # Plain keys map straight onto a path, no directory walk needed
+        name = key[len(prefix) + 1 :] if key.startswith(prefix + "/") else ""
+        path = os.path.join(directory, *name.split("/"))
+        if is_asset_name(name) and os.path.isfile(path):
+            return [(key, path)]
+        return []
+    return [
+        (f"{prefix}/{name}", path)
+        for name, path in sorted(list_assets(directory).items())
+        if key_expr.intersects(zenoh.KeyExpr(f"{prefix}/{name}"))
+    ]
+
+
+def read_payload(entry: FileEntry) -> bytes:
+    if entry.payload is not None:
+        return entry.payload
+    with open(entry.path, "rb") as f:
+        return f.read()
+
+
+@contextlib.contextmanager
+def open_data(entry: FileEntry):
+    """Yields something sliceable over the file: the cached payload or an mmap."""
+    if entry.payload is not None:
+        yield entry.payload
         return
+    with open(entry.path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
 
-    file_size = os.path.getsize(file_path)
-    sha256_hash = hashlib.sha256()
-    file_data = None
-    with open(file_path, "rb") as f:
-        file_data = f.read()
-        sha256_hash.update(file_data)
 
-    # while chunk := f.read(CHUNK_SIZE):
-    file_hash = sha256_hash.hexdigest()
-    print(f"SENT file_hash {file_hash}")
+def reply_data(
+    query: zenoh.Query,
+    key: str,
+    entry: FileEntry,
+    data,
+    header: dict,
+    codec: Optional[str],
+    level: Optional[int],
+) -> int:
+    """Replies with one piece of the file, compressed with `codec` if that
+    makes it smaller. Returns the bytes put on the wire."""
+    if codec is not None:
+        compressed = compression.compress(codec, data, level)
+        if len(compressed) < len(data):
+            header = dict(header, compression=codec)
+            data = compressed
+    query.reply(
+        key,
+        data,
+        encoding=entry.encoding,
+        attachment=json.dumps(header),
+    )
+    return len(data)
+
 
-    # metadata = f"{file_hash}|{file_size}".encode()
-    # query.reply(query.key_expr, metadata, encoding=zenoh.Encoding.TEXT_JSON5)
-    # print(f"SENT metadata {metadata}")
+def reply_chunks(
+    query: zenoh.Query,
+    key: str,
+    entry: FileEntry,
+    chunk_size: int,
+    codec: Optional[str] = None,
+    level: Optional[int] = None,
+):
+    """Replies with the file as a sequence of indexed chunks.
 
-    # Send chunks with index
+    Every chunk carries a JSON attachment with its index, offset, the total
+    size and the SHA-256 of the whole file, so the client can write each chunk
+    in place as soon as it arrives. Chunks are compressed independently, and
+    offsets and sizes always refer to the uncompressed file. Files too large
+    for the cache are sliced from an mmap.
+    """
+    file_size = entry.size
+    count = (file_size + chunk_size - 1) // chunk_size
     start_time = time.time()
-    query.reply(query.key_expr, file_data, encoding=zenoh.Encoding.TEXT_JSON5)
+    sent = 0
+    print(f"SENT file_hash {entry.sha256} in {count} chunks")
+    with open_data(entry) as data:
+        for index, offset in enumerate(range(0, file_size, chunk_size)):
+            header = {
+                "index": index,
+                "count": count,
+                "offset": offset,
+                "size": file_size,
+                "sha256": entry.sha256,
+            }
+            sent += reply_data(
+                query,
+                key,
+                entry,
+                data[offset : offset + chunk_size],
+                header,
+                codec,
+                level,
+            )
+    duration = time.time() - start_time
+    print(
+        f">> [Queryable] Streamed {count} chunks ({sent}/{file_size} bytes, {codec or 'uncompressed'}): {duration:.5f}s, {(file_size / duration) / (1024*1024):.2f} MB/s"
+    )
+
+
+def reply_range(
+    query: zenoh.Query,
+    key: str,
+    entry: FileEntry,
+    offset: int,
+    length: int,
+    codec: Optional[str] = None,
+    level: Optional[int] = None,
+):
+    """Replies with `length` bytes starting at `offset`, clamped to the file size."""
+    if offset < 0 or length < 0 or offset > entry.size:
+        query.reply_err(f"Invalid range offset={offset} len={length}")
+        return
+    header = {"offset": offset, "size": entry.size, "sha256": entry.sha256}
+    with open_data(entry) as data:
+        sent = reply_data(
+            query, key, entry, data[offset : offset + length], header, codec, level
+        )
+    print(f">> [Queryable] Sent range offset={offset} len={length} ({sent} bytes)")
+
+
+def make_query_handler(directory: str, prefix: str):
+    """Serves every file under `directory` as `<prefix>/<relative/path>`.
+
+    `<prefix>/@manifest` lists all assets with their size and hash in one
+    reply, and `<prefix>/@stats` reports the cache statistics.
+    """
+    manifest_key = zenoh.KeyExpr(f"{prefix}/@manifest")
+    stats_key = zenoh.KeyExpr(f"{prefix}/@stats")
+
+    def query_handler(query: zenoh.Query):
+        print(f">> [Queryable ] Received Query '{query.selector}'")
+        parameters = query_parameters(query)
+        if query.key_expr.intersects(manifest_key):
+            reply_manifest(query, str(manifest_key), directory, prefix)
+        if query.key_expr.intersects(stats_key):
+            stats = {"files": file_cache.stats(), "variants": variant_cache.stats()}
+            query.reply(
+                stats_key, json.dumps(stats), encoding=zenoh.Encoding.APPLICATION_JSON
+            )
+        if query.key_expr.intersects(manifest_key) or query.key_expr.intersects(
+            stats_key
+        ):
+            return
+
+        assets = resolve_assets(directory, prefix, query.key_expr)
+        if len(assets) != 1:
+            print(f"'{query.key_expr}' matches {len(assets)} assets in {directory}")
+            query.reply_err(
+                f"'{query.key_expr}' matches {len(assets)} assets, "
+                f"ask for one of those listed by '{manifest_key}'"
+            )
+            return
+        key, path = assets[0]
+        entry = file_cache.get(path)
+        if entry is None:
+            query.reply_err(f"'{key}' no longer exists")
+            return
+
+        # `?w=..&q=..&fmt=..` asks for a resized or re-encoded variant, which
+        # is rendered in the background and then served like the original file
+        try:
+            variant = parse_variant(parameters)
+        except ValueError as e:
+            query.reply_err(f"Invalid variant in '{query.selector}': {e}")
+            return
+        if variant is not None:
+
+            def on_rendered(future: Future):
+                try:
+                    reply_entry(query, key, future.result(), parameters)
+                except ValueError as e:
+                    query.reply_err(str(e))
+                except Exception as e:
+                    query.reply_err(f"Rendering failed: {e}")
+
+            variant_cache.get(entry, *variant).add_done_callback(on_rendered)
+            return
+
+        reply_entry(query, key, entry, parameters)
+
+    return query_handler
+
+
+def reply_manifest(query: zenoh.Query, manifest_key: str, directory: str, prefix: str):
+    """Names, keys, sizes and hashes of all assets, in one JSON reply."""
+    assets = []
+    for name, path in sorted(list_assets(directory).items()):
+        entry = file_cache.get(path, load=False)
+        if entry is None:
+            continue
+        assets.append(
+            {
+                "name": name,
+                "key": f"{prefix}/{name}",
+                "size": entry.size,
+                "sha256": entry.sha256,
+                "mime": entry.mime,
+            }
+        )
+    query.reply(
+        manifest_key,
+        json.dumps({"assets": assets}),
+        encoding=zenoh.Encoding.APPLICATION_JSON,
+    )
+    print(f">> [Queryable] Sent manifest of {len(assets)} assets")
+
+
+def reply_entry(
+    query: zenoh.Query, key: str, entry: FileEntry, parameters: zenoh.Parameters
+):
+    # `?meta=true` only returns the size and hash, e.g. to plan range requests
+    if parameters.get("meta") == "true":
+        metadata = {"size": entry.size, "sha256": entry.sha256}
+        query.reply(
+            key,
+            json.dumps(metadata),
+            encoding=zenoh.Encoding.APPLICATION_JSON,
+        )
+        return
+
+    # `?if_none_match=<sha256>` gets an empty "not modified" reply when the
+    # client already holds the current content
+    if parameters.get("if_none_match") == entry.sha256:
+        header = {"not_modified": True, "size": entry.size, "sha256": entry.sha256}
+        query.reply(
+            key,
+            b"",
+            encoding=entry.encoding,
+            attachment=json.dumps(header),
+        )
+        print(f">> [Queryable] Not modified: {entry.sha256}")
+        return
+
+    # `?compress=zstd,zlib` lists the codecs the client accepts, in order of
+    # preference; `level` overrides the codec's default level
+    codec = compression.negotiate(
+        compression.parse_codecs(parameters.get("compress")), entry.mime
+    )
+    try:
+        level = parameters.get("level")
+        level = int(level) if level is not None else None
+    except ValueError:
+        query.reply_err(f"Invalid compression level in '{query.selector}'")
+        return
+
+    # `?offset=..&len=..` asks for a single byte range
+    offset = parameters.get("offset")
+    if offset is not None:
+        length = parameters.get("len")
+        try:
+            offset = int(offset)
+            length = int(length) if length is not None else entry.size
+        except ValueError:
+            query.reply_err(f"Invalid range parameters in '{query.selector}'")
+            return
+        reply_range(query, key, entry, offset, length, codec, level)
+        return
+
+    # `?stream=true` asks for chunked replies instead of one monolithic reply
+    file_size = entry.size
+    if parameters.get("stream") == "true" and file_size > 0:
+        try:
+            chunk_size = int(parameters.get("chunk") or CHUNK_SIZE)
+        except ValueError:
+            chunk_size = 0
+        if chunk_size <= 0:
+            query.reply_err(f"Invalid chunk size in '{query.selector}'")
+            return
+        chunk_size = min(chunk_size, MAX_CHUNK_SIZE)
+        reply_chunks(query, key, entry, chunk_size, codec, level)
+        return
+
+    file_data = read_payload(entry)
+    print(f"SENT file_hash {entry.sha256}")
+
+    start_time = time.time()
+    header = {"size": file_size, "sha256": entry.sha256}
+    sent = reply_data(query, key, entry, file_data, header, codec, level)
     end_time = time.time()
     duration = end_time - start_time
     print(
-        f">> [Queryable] Transfer complete: {duration:.5f}s, {(file_size / duration) / (1024*1024):.2f} MB/s"
+        f">> [Queryable] Transfer complete ({sent}/{file_size} bytes, {codec or 'uncompressed'}): {duration:.5f}s, {(file_size / duration) / (1024*1024):.2f} MB/s"
     )
 
 
-def main(conf: zenoh.Config, key: str):
+def watch_assets(
+    session: zenoh.Session,
+    directory: str,
+    prefix: str,
+    poll_interval: Optional[float],
+) -> DirectoryWatcher:
+    """Publishes `{"key", "name", "size", "sha256"}`, or `"deleted": true`,
+    on `<prefix>/@changes` for every asset whose content changed."""
+    changes_key = f"{prefix}/@changes"
+    pub = session.declare_publisher(
+        changes_key, encoding=zenoh.Encoding.APPLICATION_JSON
+    )
+    published: Dict[str, Optional[str]] = {}
+
+    def on_change(name: str):
+        path = os.path.join(directory, *name.split("/"))
+        entry = file_cache.get(path, load=False)
+        sha256 = entry.sha256 if entry is not None else None
+        if name in published and published[name] == sha256:
+            return  # Touched or rewritten with the same content
+        published[name] = sha256
+        change = {"key": f"{prefix}/{name}", "name": name}
+        if entry is None:
+            change["deleted"] = True
+        else:
+            change.update(size=entry.size, sha256=entry.sha256)
+        pub.put(json.dumps(change))
+        print(f">> [Changes] {change['key']}: {sha256 or 'deleted'}")
+
+    watcher = DirectoryWatcher(
+        directory,
+        on_change,
+        is_asset_name,
+        interval=poll_interval or 1.0,
+        use_inotify=poll_interval is None,
+    ).start()
+    print(f"Announcing changes on '{changes_key}' ({watcher.mode})...")
+    return watcher
+
+
+def serve(
+    session: zenoh.Session,
+    stop: threading.Event,
+    key: str = "BIG/**",
+    directory: str = ASSET_DIR,
+    cache_size: int = ASSET_CACHE_SIZE,
+    variant_cache_size: int = VARIANT_CACHE_SIZE,
+    watch: bool = True,
+    poll_interval: Optional[float] = None,
+):
+    """Answers file queries on `session` until `stop` is set.
+
+    With `watch`, every change to an asset is announced on `<prefix>/@changes`
+    with its key and new hash, so clients never have to poll. Changes come
+    from inotify, or from polling every `poll_interval` seconds when given or
+    when inotify is unavailable.
+    """
+    if not key.endswith("/**"):
+        raise ValueError(f"Expected a key ending in '/**', got {key!r}")
+    prefix = key[: -len("/**")]
+    file_cache.max_bytes = cache_size
+    variant_cache.max_bytes = variant_cache_size
+    handler = make_query_handler(directory, prefix)
+    print(
+        f"File Service active on '{key}' for {len(list_assets(directory))} assets in {directory}..."
+    )
+    # `**` never matches the verbatim `@` chunks, so they are declared apart
+    queryables = [
+        session.declare_queryable(key_expr, handler)
+        for key_expr in (key, f"{prefix}/@manifest", f"{prefix}/@stats")
+    ]
+    watcher = None
+    if watch:
+        watcher = watch_assets(session, directory, prefix, poll_interval)
+    try:
+        stop.wait()
+    finally:
+        if watcher is not None:
+            watcher.close()
+        for queryable in queryables:
+            queryable.undeclare()
+        print(f">> [Cache] Files: {file_cache.stats()}")
+        print(f">> [Variant] Cache: {variant_cache.stats()}")
+
+
+def main(
+    conf: zenoh.Config,
+    key: str,
+    directory: str,
+    cache_size: int,
+    variant_cache_size: int,
+    watch: bool,
+    poll_interval: Optional[float],
+):
     zenoh.init_log_from_env_or("error")
     print(f"Current Config: {conf}")
 
     print("Opening session...")
     with zenoh.open(conf) as session:
-        print(f"File Service active on '{key}'...")
-        session.declare_queryable(key, query_handler)
-
         print("Press CTRL-C to quit...")
-        while True:
-            time.sleep(1)
+        serve(
+            session,
+            threading.Event(),
+            key,
+            directory,
+            cache_size,
+            variant_cache_size,
+            watch,
+            poll_interval,
+        )
 
 
 # --- Command line argument parsing --- --- --- --- --- ---
@@ -73,10 +736,52 @@ if __name__ == "__main__":
         dest="key",
         default="BIG/**",
         type=str,
-        help="The key expression to subscribe to.",
+        help="Key expression to serve, assets are '<prefix>/<relative/path>'.",
+    )
+    parser.add_argument(
+        "--dir",
+        "-d",
+        dest="directory",
+        default=ASSET_DIR,
+        type=str,
+        help="Directory of the assets to serve.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        default=ASSET_CACHE_SIZE // (1024 * 1024),
+        type=int,
+        help="Megabytes of file contents to keep in memory.",
+    )
+
+    parser.add_argument(
+        "--variant-cache",
+        default=VARIANT_CACHE_SIZE // (1024 * 1024),
+        type=int,
+        help="Megabytes of rendered image variants (?w=..&q=..&fmt=..) to keep.",
+    )
+
+    parser.add_argument(
+        "--no-watch",
+        dest="watch",
+        action="store_false",
+        help="Do not announce asset changes on '<prefix>/@changes'.",
+    )
+    parser.add_argument(
+        "--poll",
+        dest="poll_interval",
+        type=float,
+        help="Poll the directory every this many seconds instead of using inotify.",
     )
 
     args = parser.parse_args()
     conf = common.get_config_from_args(args)
 
-    main(conf, args.key)
+    main(
+        conf,
+        args.key,
+        args.directory,
+        args.cache_size * 1024 * 1024,
+        args.variant_cache * 1024 * 1024,
+        args.watch,
+        args.poll_interval,
+    )
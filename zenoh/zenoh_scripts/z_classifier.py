@@ -0,0 +1,334 @@
+import asyncio
+import json
+import multiprocessing
+import re
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import zenoh
+from zenoh.ext import HistoryConfig, Miss, RecoveryConfig, declare_advanced_subscriber
+
+from common import imu_codec
+from common.action_model import classify, init_worker
+from common.callback_log import CallbackLog, add_log_arguments, get_log_from_args
+from common.flush_scheduler import FlushScheduler
+from common.imu_features import MOTION_FIELDS, SampleWindow
+
+BATCH = "batch"  # The scheduler's single key: all players share one batch
+
+
+async def run(
+    session: zenoh.Session,
+    stop: threading.Event,
+    log: CallbackLog,
+    sub_key: str,
+    action_prefix: str,
+    window: int,
+    hop: int,
+    batch_size: int,
+    deadline: float,
+    workers: int,
+    model: Optional[str],
+    classes: int,
+):
+    loop = asyncio.get_running_loop()
+
+    # Callback side: one window per device, each behind its own lock
+    windows: Dict[str, Tuple[threading.Lock, SampleWindow]] = {}
+    windows_lock = threading.Lock()
+
+    # Event loop side: windows waiting for the next batch, and one
+    # publisher per player
+    pending: List[Tuple[str, np.ndarray]] = []
+    publishers: Dict[str, zenoh.Publisher] = {}
+
+    def publisher_for(key: str) -> zenoh.Publisher:
+        pub = publishers.get(key)
+        if pub is None:
+            # `esp/imu2` plays as player 2, other names take the next number
+            match = re.search(r"(\d+)$", key)
+            number = int(match.group(1)) if match else len(publishers) + 1
+            out_key = f"{action_prefix}{number}"
+            print(f"Publishing actions of '{key}' on '{out_key}'...")
+            pub = publishers[key] = session.declare_publisher(out_key)
+        return pub
+
+    # Spawned rather than forked workers, so they do not inherit the
+    # session's threads
+    pool = ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(model, window * len(MOTION_FIELDS), classes),
+    )
+    # At most two batches per worker in flight; windows arriving meanwhile
+    # wait in `pending` and make the next batch bigger, and past
+    # `max_pending` the oldest are dropped
+    max_in_flight = 2 * workers
+    max_pending = max_in_flight * batch_size
+    dropped = 0
+
+    async def infer(batch: List[Tuple[str, np.ndarray]]):
+        inputs = np.stack([values for _, values in batch])
+        actions, confidences = await loop.run_in_executor(pool, classify, inputs)
+        for (key, _), action, confidence in zip(batch, actions, confidences):
+            data = {
+                "action": int(action),
+                "source": key,
+                "confidence": float(confidence),
+            }
+            publisher_for(key).put(json.dumps(data))
+        log.sample(
+            ">> [Classifier] Batch of {} windows from {} players",
+            len(batch),
+            len({key for key, _ in batch}),
+        )
+
+    # Referenced until done, so batches are not garbage collected mid-flight
+    # and their failures get logged
+    tasks: Set[asyncio.Task] = set()
+
+    def on_done(task: asyncio.Task):
+        tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.event(">> [Warning] Classifying a batch failed: {!r}", task.exception())
+        # A slot is free: the windows that waited for it go next
+        emit(BATCH)
+
+    def emit(_key: str):
+        if not pending or len(tasks) >= max_in_flight:
+            return
+        batch = pending[:]
+        pending.clear()
+        task = loop.create_task(infer(batch))
+        tasks.add(task)
+        task.add_done_callback(on_done)
+
+    scheduler = FlushScheduler(loop, deadline, batch_size, emit)
+
+    def on_window(key: str, values: np.ndarray):
+        nonlocal dropped
+        if len(pending) >= max_pending:
+            del pending[0]
+            dropped += 1
+            if dropped % 100 == 1:
+                log.event(
+                    ">> [Warning] Workers behind, {} windows dropped so far", dropped
+                )
+        pending.append((key, values))
+        scheduler.add(BATCH)
+
+    def listener(sample: zenoh.Sample):
+        try:
+            frame = imu_codec.decode_frame_sample(sample)
+        except (ValueError, struct.error):
+            log.event(">> [Warning] Undecodable data ignored on '{}'", sample.key_expr)
+            return
+
+        key = str(sample.key_expr)
+        with windows_lock:
+            entry = windows.get(key)
+            if entry is None:
+                entry = windows[key] = (
+                    threading.Lock(),
+                    SampleWindow(window, len(MOTION_FIELDS)),
+                )
+        lock, ring = entry
+        with lock:
+            ring.push(frame.values[:, : len(MOTION_FIELDS)], frame.timestamp_ms)
+            if ring.size < ring.capacity or ring.pending < hop:
+                return
+            ring.pending = 0
+            values, _ = ring.values()
+        loop.call_soon_threadsafe(on_window, key, values)
+
+    print(f"Declaring Subscriber on '{sub_key}'...")
+    sub = declare_advanced_subscriber(
+        session,
+        sub_key,
+        listener,
+        history=HistoryConfig(detect_late_publishers=True),
+        recovery=RecoveryConfig(heartbeat=True),
+        subscriber_detection=True,
+    )
+
+    def miss_listener(miss: Miss):
+        log.event(">> [Subscriber] Missed {} samples from {} !!!", miss.nb, miss.source)
+
+    sub.sample_miss_listener(miss_listener)
+
+    print(
+        f"Classifying windows of {window} samples in batches of up to {batch_size} "
+        f"or every {deadline}s on {workers} workers..."
+    )
+    stopped = asyncio.Event()
+
+    def wait_for_stop():
+        stop.wait()
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(stopped.set)
+
+    threading.Thread(target=wait_for_stop, name="classifier-stop", daemon=True).start()
+    try:
+        await stopped.wait()
+    finally:
+        sub.undeclare()
+        scheduler.close()
+        # Let the batches in flight, and those waiting for them, be published
+        while tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if dropped:
+            log.event(">> [Classifier] {} windows dropped in total", dropped)
+        pool.shutdown()
+        for pub in publishers.values():
+            pub.undeclare()
+
+
+def serve(
+    session: zenoh.Session,
+    stop: threading.Event,
+    log: CallbackLog,
+    sub_key: str = "esp/**",
+    action_prefix: str = "ultra/action",
+    window: int = 64,
+    hop: int = 16,
+    batch_size: int = 16,
+    deadline: float = 0.05,
+    workers: int = 3,
+    model: Optional[str] = None,
+    classes: int = 11,
+):
+    """Runs the classifier on its own event loop until `stop` is set."""
+    asyncio.run(
+        run(
+            session,
+            stop,
+            log,
+            sub_key,
+            action_prefix,
+            window,
+            hop,
+            batch_size,
+            deadline,
+            workers,
+            model,
+            classes,
+        )
+    )
+
+
+def main(
+    conf: zenoh.Config,
+    sub_key: str,
+    action_prefix: str,
+    window: int,
+    hop: int,
+    batch_size: int,
+    deadline: float,
+    workers: int,
+    model: Optional[str],
+    classes: int,
+    log: CallbackLog,
+):
+    zenoh.init_log_from_env_or("error")
+    print(f"Current Config: {conf}")
+    if model is None:
+        print("!! No --model given, using an untrained MLP")
+
+    print("Opening session...")
+    try:
+        with zenoh.open(conf) as session:
+            serve(
+                session,
+                threading.Event(),
+                log,
+                sub_key,
+                action_prefix,
+                window,
+                hop,
+                batch_size,
+                deadline,
+                workers,
+                model,
+                classes,
+            )
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        log.close()
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(
+        prog="z_classifier", description="Batched action classification"
+    )
+    common.add_config_arguments(parser)
+    add_log_arguments(parser)
+    parser.add_argument(
+        "--sub-key", "-s", default="esp/**", help="Key to subscribe to."
+    )
+    parser.add_argument(
+        "--key",
+        "-k",
+        dest="action_prefix",
+        default="ultra/action",
+        help="Prefix to publish actions onto, followed by the player number.",
+    )
+    parser.add_argument(
+        "--window", "-w", type=int, default=64, help="Samples per classified window."
+    )
+    parser.add_argument(
+        "--hop",
+        type=int,
+        default=16,
+        help="New samples per player between two classifications.",
+    )
+    parser.add_argument(
+        "--batch",
+        "-b",
+        dest="batch_size",
+        type=int,
+        default=16,
+        help="Run inference once this many windows are waiting.",
+    )
+    parser.add_argument(
+        "--deadline",
+        "-d",
+        type=float,
+        default=0.05,
+        help="Seconds a window may wait for its batch to fill.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=3, help="Inference worker processes."
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        help="Model weights: an .npz MLP or an .onnx file (needs onnxruntime).",
+    )
+    parser.add_argument(
+        "--classes", type=int, default=11, help="Classes of the untrained MLP."
+    )
+
+    args = parser.parse_args()
+    main(
+        common.get_config_from_args(args),
+        args.sub_key,
+        args.action_prefix,
+        args.window,
+        args.hop,
+        args.batch_size,
+        args.deadline,
+        args.workers,
+        args.model,
+        args.classes,
+        get_log_from_args(args),
+    )
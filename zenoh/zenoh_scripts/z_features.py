@@ -0,0 +1,225 @@
+import json
+import struct
+import threading
+from typing import Dict, Optional, Tuple
+
+import zenoh
+from zenoh.ext import HistoryConfig, Miss, RecoveryConfig, declare_advanced_subscriber
+
+from common import imu_codec
+from common.callback_log import CallbackLog, add_log_arguments, get_log_from_args
+from common.imu_features import MOTION_FIELDS, SampleWindow, extract_features
+from common.ingest_queue import IngestQueue, add_ingest_arguments
+
+
+def device_name(key: str) -> str:
+    """`esp/imu1` -> `imu1`: the key without its top-level prefix."""
+    return key.split("/", 1)[1] if "/" in key else key
+
+
+def serve(
+    session: zenoh.Session,
+    stop: threading.Event,
+    log: CallbackLog,
+    sub_key: str = "esp/**",
+    features_prefix: str = "ultra/features",
+    window: int = 128,
+    hop: int = 32,
+    rate: Optional[float] = None,
+    queue_size: int = 1024,
+    overload: str = "coalesce",
+):
+    """Publishes features of the last `window` samples of each device every
+    `hop` new samples, on `<features_prefix>/<device>`.
+
+    `rate` is the devices' nominal sample rate in Hz; without it the rate is
+    derived from the sample timestamps, and windows without usable ones are
+    skipped.
+    """
+    devices: Dict[str, Tuple[threading.Lock, SampleWindow, zenoh.Publisher]] = {}
+    devices_lock = threading.Lock()
+
+    def device_for(key: str):
+        with devices_lock:
+            device = devices.get(key)
+            if device is None:
+                out_key = f"{features_prefix}/{device_name(key)}"
+                print(f"Publishing features of '{key}' on '{out_key}'...")
+                device = devices[key] = (
+                    threading.Lock(),
+                    SampleWindow(window, len(MOTION_FIELDS)),
+                    session.declare_publisher(
+                        out_key, encoding=zenoh.Encoding.APPLICATION_JSON
+                    ),
+                )
+            return device
+
+    # Windows due for features, computed on the consumer thread rather than
+    # in the callback; by default only the latest window of a device waits
+    windows = IngestQueue(queue_size, overload)
+    skipped = 0
+
+    def consume():
+        nonlocal skipped
+        for key, (values, time_ms) in iter(windows.get, None):
+            try:
+                features = extract_features(values, time_ms, rate=rate)
+            except ValueError:
+                skipped += 1
+                if skipped % 100 == 1:
+                    log.event(
+                        ">> [Warning] {} windows without usable timestamps skipped, "
+                        "pass --rate to use them",
+                        skipped,
+                    )
+                continue
+            features["source"] = key
+            device_for(key)[2].put(json.dumps(features))
+            log.sample(
+                ">> [Features] {}: accel_rms={:.3f} gyro_rms={:.3f} jerk_rms={:.1f} @ {:.1f}Hz",
+                key,
+                features["accel_rms"],
+                features["gyro_rms"],
+                features["jerk_rms"],
+                features["rate_hz"],
+            )
+
+    consumer = threading.Thread(target=consume, name="features")
+    consumer.start()
+
+    def listener(sample: zenoh.Sample):
+        try:
+            frame = imu_codec.decode_frame_sample(sample)
+        except (ValueError, struct.error):
+            log.event(">> [Warning] Undecodable data ignored on '{}'", sample.key_expr)
+            return
+
+        key = str(sample.key_expr)
+        lock, ring, _ = device_for(key)
+        with lock:
+            ring.push(frame.values[:, : len(MOTION_FIELDS)], frame.timestamp_ms)
+            if ring.size < ring.capacity or ring.pending < hop:
+                return
+            ring.pending = 0
+            values, time_ms = ring.values()
+        windows.put(key, (values, time_ms))
+
+    print(f"Declaring Subscriber on '{sub_key}'...")
+    sub = declare_advanced_subscriber(
+        session,
+        sub_key,
+        listener,
+        history=HistoryConfig(detect_late_publishers=True),
+        recovery=RecoveryConfig(heartbeat=True),
+        subscriber_detection=True,
+    )
+
+    def miss_listener(miss: Miss):
+        log.event(">> [Subscriber] Missed {} samples from {} !!!", miss.nb, miss.source)
+
+    sub.sample_miss_listener(miss_listener)
+    try:
+        stop.wait()
+    finally:
+        sub.undeclare()
+        windows.close()
+        consumer.join()
+        log.event(">> [Features] Window queue {}", windows.format_stats())
+        for _, _, pub in devices.values():
+            pub.undeclare()
+
+
+def main(
+    conf: zenoh.Config,
+    sub_key: str,
+    features_prefix: str,
+    window: int,
+    hop: int,
+    rate: Optional[float],
+    queue_size: int,
+    overload: str,
+    log: CallbackLog,
+):
+    zenoh.init_log_from_env_or("error")
+    print(f"Current Config: {conf}")
+
+    print("Opening session...")
+    with zenoh.open(conf) as session:
+        print("Press CTRL-C to quit...")
+        try:
+            serve(
+                session,
+                threading.Event(),
+                log,
+                sub_key,
+                features_prefix,
+                window,
+                hop,
+                rate,
+                queue_size,
+                overload,
+            )
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+        finally:
+            log.close()
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(
+        prog="z_features", description="Windowed IMU feature extraction"
+    )
+    common.add_config_arguments(parser)
+    add_log_arguments(parser)
+    add_ingest_arguments(parser)
+    # Only the latest window of a device is worth computing
+    parser.set_defaults(overload="coalesce")
+    parser.add_argument(
+        "--sub-key", "-s", default="esp/**", help="Key to subscribe to."
+    )
+    parser.add_argument(
+        "--key",
+        "-k",
+        dest="features_prefix",
+        default="ultra/features",
+        help="Prefix to publish features onto, followed by the device name.",
+    )
+    parser.add_argument(
+        "--window",
+        "-w",
+        type=int,
+        default=128,
+        help="Samples per device the features are computed over.",
+    )
+    parser.add_argument(
+        "--hop",
+        type=int,
+        default=32,
+        help="New samples per device between two feature publications.",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="Nominal sample rate in Hz, for devices without usable timestamps "
+        "(e.g. JSON samples); by default it is derived from the timestamps.",
+    )
+
+    args = parser.parse_args()
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+    main(
+        common.get_config_from_args(args),
+        args.sub_key,
+        args.features_prefix,
+        args.window,
+        args.hop,
+        args.rate,
+        args.queue_size,
+        args.overload,
+        get_log_from_args(args),
+    )
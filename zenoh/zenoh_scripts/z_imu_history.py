@@ -0,0 +1,198 @@
+import re
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import zenoh
+from zenoh.ext import HistoryConfig, RecoveryConfig, declare_advanced_subscriber
+
+from common import imu_codec
+from common.common import query_parameters
+from common.history_store import HistoryStore
+
+
+def parse_time(value: Optional[str], now_ns: int, default: int) -> int:
+    """Seconds since the UNIX epoch, or before now when negative."""
+    if not value:
+        return default
+    seconds = float(value)
+    if seconds < 0:
+        return now_ns + int(seconds * 1e9)
+    return int(seconds * 1e9)
+
+
+def downsample(history: imu_codec.ImuHistory, step_ns: int) -> imu_codec.ImuHistory:
+    """Keeps the first sample of every `step_ns` bucket."""
+    if step_ns <= 0 or not len(history.time_ns):
+        return history
+    buckets = (history.time_ns - history.time_ns[0]) // step_ns
+    keep = np.flatnonzero(np.diff(buckets, prepend=-1))
+    return imu_codec.ImuHistory(
+        history.time_ns[keep], history.values[keep], history.action[keep]
+    )
+
+
+def sample_times_ns(sample: zenoh.Sample, frame: imu_codec.ImuBatch) -> np.ndarray:
+    """Spreads a frame over time, ending at its HLC (or receive) time."""
+    if sample.timestamp is not None:
+        end_ns = sample.timestamp.get_time_as_ntp64().as_nanos()
+    else:
+        end_ns = time.time_ns()
+    offsets_ms = frame.timestamp_ms.astype(np.int64) - int(frame.timestamp_ms[-1])
+    return end_ns + offsets_ms * 1_000_000
+
+
+def serve(
+    session: zenoh.Session,
+    stop: threading.Event,
+    key: str = "esp/**",
+    capacity: int = 65536,
+    spill_dir: Optional[str] = "history",
+    spill_rows: int = 1 << 20,
+):
+    """Stores every IMU frame on `key` and answers time-range queries on it."""
+    stores: Dict[str, HistoryStore] = {}
+    stores_lock = threading.Lock()
+    if spill_dir is not None:
+        Path(spill_dir).mkdir(parents=True, exist_ok=True)
+
+    def store_for(key_str: str) -> HistoryStore:
+        with stores_lock:
+            store = stores.get(key_str)
+            if store is None:
+                spill_path = None
+                if spill_dir is not None:
+                    name = re.sub(r"[^\w.-]", "_", key_str)
+                    spill_path = Path(spill_dir) / f"{name}.spill"
+                store = stores[key_str] = HistoryStore(capacity, spill_path, spill_rows)
+            return store
+
+    def listener(sample: zenoh.Sample):
+        try:
+            frame = imu_codec.decode_frame_sample(sample)
+        except (ValueError, struct.error):
+            return
+        store_for(str(sample.key_expr)).append(
+            sample_times_ns(sample, frame), frame.values, frame.action
+        )
+
+    def query_handler(query: zenoh.Query):
+        now_ns = time.time_ns()
+        parameters = query_parameters(query)
+        try:
+            start_ns = parse_time(parameters.get("from"), now_ns, 0)
+            end_ns = parse_time(parameters.get("to"), now_ns, np.iinfo(np.int64).max)
+            step_ns = int(float(parameters.get("step") or 0) * 1e9)
+        except ValueError:
+            query.reply_err(f"Invalid from/to/step in '{query.selector}'")
+            return
+
+        with stores_lock:
+            matching = [
+                (key_str, store)
+                for key_str, store in stores.items()
+                if query.key_expr.intersects(zenoh.KeyExpr(key_str))
+            ]
+        for key_str, store in matching:
+            history = downsample(store.query(start_ns, end_ns), step_ns)
+            # One packed reply per key instead of one reply per sample
+            query.reply(
+                key_str,
+                imu_codec.encode_history(*history),
+                encoding=imu_codec.IMU_ENCODING,
+            )
+        print(
+            f">> [History] '{query.selector}': {len(matching)} keys, took {(time.time_ns() - now_ns) / 1e6:.2f}ms"
+        )
+
+    print(f"Storing history of '{key}' (spilling to '{spill_dir}')...")
+    subscriber = declare_advanced_subscriber(
+        session,
+        key,
+        listener,
+        history=HistoryConfig(detect_late_publishers=True),
+        recovery=RecoveryConfig(heartbeat=True),
+        subscriber_detection=True,
+    )
+    queryable = session.declare_queryable(key, query_handler)
+    try:
+        stop.wait()
+    finally:
+        queryable.undeclare()
+        subscriber.undeclare()
+
+
+def main(
+    conf: zenoh.Config,
+    key: str,
+    capacity: int,
+    spill_dir: Optional[str],
+    spill_rows: int,
+):
+    zenoh.init_log_from_env_or("error")
+    print(f"Current Config: {conf}")
+
+    print("Opening session...")
+    with zenoh.open(conf) as session:
+        print("Press CTRL-C to quit...")
+        try:
+            serve(session, threading.Event(), key, capacity, spill_dir, spill_rows)
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(
+        prog="z_imu_history",
+        description="Time-range IMU history, e.g. 'esp/imu1?from=-10&step=0.1'",
+    )
+    common.add_config_arguments(parser)
+    parser.add_argument(
+        "--key", "-k", default="esp/**", type=str, help="Key expression to store."
+    )
+    parser.add_argument(
+        "--capacity",
+        default=65536,
+        type=int,
+        help="Samples kept in memory per key.",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        default="history",
+        type=str,
+        help="Directory for samples evicted from memory.",
+    )
+    parser.add_argument(
+        "--no-spill",
+        dest="spill_dir",
+        action="store_const",
+        const=None,
+        help="Drop samples evicted from memory.",
+    )
+    parser.add_argument(
+        "--spill-rows",
+        default=1 << 20,
+        type=int,
+        help="Rows per spill segment; one previous segment is kept.",
+    )
+
+    args = parser.parse_args()
+    if args.spill_rows < args.capacity // 2:
+        parser.error(
+            f"--spill-rows must be at least half of --capacity ({args.capacity // 2})"
+        )
+    main(
+        common.get_config_from_args(args),
+        args.key,
+        args.capacity,
+        args.spill_dir,
+        args.spill_rows,
+    )
@@ -0,0 +1,58 @@
+from typing import Optional
+
+import numpy as np
+import zenoh
+
+from common import imu_codec
+
+
+def main(conf: zenoh.Config, selector: str, timeout: float, save: Optional[str]):
+    zenoh.init_log_from_env_or("error")
+
+    print("Opening session...")
+    with zenoh.open(conf) as session:
+        print(f"Sending Query '{selector}'...")
+        arrays = {}
+        for reply in session.get(selector, timeout=timeout):
+            if reply.err is not None:
+                print(f">> Received ERROR '{reply.err.payload.to_string()}'")
+                continue
+            sample = reply.ok
+            history = imu_codec.decode_history(sample.payload.to_bytes())
+            count = len(history.time_ns)
+            span = (history.time_ns[-1] - history.time_ns[0]) / 1e9 if count else 0.0
+            print(
+                f">> '{sample.key_expr}': {count} samples over {span:.3f}s ({len(sample.payload)} bytes)"
+            )
+            key = str(sample.key_expr)
+            arrays[f"{key}/time_ns"] = history.time_ns
+            arrays[f"{key}/values"] = history.values
+            arrays[f"{key}/action"] = history.action
+
+        if save:
+            np.savez(save, **arrays)
+            print(f"Saved to {save}")
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(
+        prog="z_imu_history_get", description="Fetch IMU history from z_imu_history"
+    )
+    common.add_config_arguments(parser)
+    parser.add_argument(
+        "--selector",
+        "-s",
+        default="esp/**?from=-10",
+        type=str,
+        help="Keys and time range, from/to in UNIX seconds or negative for 'ago', step in seconds.",
+    )
+    parser.add_argument("--timeout", "-o", default=10.0, type=float)
+    parser.add_argument("--save", type=str, help="Save the arrays to this .npz file.")
+
+    args = parser.parse_args()
+    main(common.get_config_from_args(args), args.selector, args.timeout, args.save)
@@ -14,12 +14,24 @@
 import time
 from typing import Optional
 
+import numpy as np
 import zenoh
 from zenoh import ZBytes
 from zenoh.ext import CacheConfig, MissDetectionConfig, declare_advanced_publisher
 
+from common import imu_codec
+from common.latency import send_time_attachment
 
-def main(conf: zenoh.Config, key: str, history: int):
+
+def main(
+    conf: zenoh.Config,
+    key: str,
+    history: int,
+    wire_format: str,
+    rate: float,
+    batch: int,
+    embed_send_time: bool = False,
+):
     # initiate logging
     zenoh.init_log_from_env_or("error")
 
@@ -34,8 +46,14 @@ def main(conf: zenoh.Config, key: str, history: int):
             publisher_detection=True,
         )
 
+        # Samples of the batch being filled, packed into one put once full
+        values = np.zeros((batch, len(imu_codec.SENSOR_FIELDS)), dtype=np.float32)
+        actions = np.zeros(batch, dtype=np.uint16)
+        timestamps = np.zeros(batch, dtype=np.int64)
+
         print("Press CTRL-C to quit...")
         for idx in itertools.count():
+            time.sleep(1.0 / rate)
 
             ax, ay, az, gx, gy, gz = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
             imu1 = {
@@ -47,13 +65,33 @@ def main(conf: zenoh.Config, key: str, history: int):
                 "gz": gz,
                 "action": 0,
             }
-            payload_string: str = json.dumps(imu1)
-            # Adapted from https://github.com/eclipse-zenoh/zenoh-python/blob/1.0.0-beta.4/examples/z_bytes.py
-            assert payload_string is not None
-            payload_bytes = ZBytes(payload_string)
-            time.sleep(1)
-            print(f"Putting Data ('{key}': '{payload_bytes}')... index: {idx}")
-            pub.put(payload_bytes)
+            if batch > 1:
+                row = idx % batch
+                values[row] = [imu1.get(f, 0.0) for f in imu_codec.SENSOR_FIELDS]
+                actions[row] = imu1["action"]
+                timestamps[row] = int(time.monotonic() * 1000)
+                if row < batch - 1:
+                    continue
+                payload_bytes = ZBytes(
+                    imu_codec.encode_batch(values, actions, timestamps, idx - row)
+                )
+                encoding = imu_codec.IMU_ENCODING
+            elif wire_format == "binary":
+                timestamp_ms = int(time.monotonic() * 1000)
+                payload_bytes = ZBytes(imu_codec.encode_record(imu1, idx, timestamp_ms))
+                encoding = imu_codec.IMU_ENCODING
+            else:
+                payload_string: str = json.dumps(imu1)
+                # Adapted from https://github.com/eclipse-zenoh/zenoh-python/blob/1.0.0-beta.4/examples/z_bytes.py
+                assert payload_string is not None
+                payload_bytes = ZBytes(payload_string)
+                encoding = imu_codec.JSON_ENCODING
+            print(
+                f"Putting Data ('{key}': {len(payload_bytes)} bytes ({encoding}))... index: {idx}"
+            )
+            # z_sub_thr measures latency from it instead of the HLC timestamp
+            attachment = send_time_attachment() if embed_send_time else None
+            pub.put(payload_bytes, encoding=encoding, attachment=attachment)
 
 
 # --- Command line argument parsing --- --- --- --- --- ---
@@ -84,7 +122,52 @@ if __name__ == "__main__":
         help="The number of publications to keep in cache",
     )
 
+    parser.add_argument(
+        "--format",
+        dest="wire_format",
+        choices=["binary", "json"],
+        default="binary",
+        help="Wire format of each IMU sample.",
+    )
+
+    parser.add_argument(
+        "--rate",
+        dest="rate",
+        type=float,
+        default=1.0,
+        help="Samples per second",
+    )
+    parser.add_argument(
+        "--batch",
+        dest="batch",
+        type=int,
+        default=1,
+        help="Samples packed into each binary frame",
+    )
+    parser.add_argument(
+        "--embed-send-time",
+        default=False,
+        action="store_true",
+        help="Attach the send time to each sample, for latency measurements",
+    )
+
     args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    if args.batch < 1:
+        parser.error("--batch must be at least 1")
+    if (args.batch - 1) * 1000 / args.rate > 0xFFFF:
+        parser.error("--batch must span at most 65.535s at this --rate")
+    if args.batch > 1 and args.wire_format != "binary":
+        parser.error("--batch requires --format binary")
     conf = common.get_config_from_args(args)
 
-    main(conf, args.key, args.history)
+    main(
+        conf,
+        args.key,
+        args.history,
+        args.wire_format,
+        args.rate,
+        args.batch,
+        args.embed_send_time,
+    )
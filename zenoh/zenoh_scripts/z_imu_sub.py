@@ -11,14 +11,30 @@
 # Contributors:
 #   ZettaScale Zenoh Team, <zenoh@zettascale.tech>
 #
+import struct
+import threading
 import time
 
 import zenoh
 from zenoh.ext import HistoryConfig, Miss, RecoveryConfig, declare_advanced_subscriber
-import json
 
+from common import imu_codec
+from common.callback_log import CallbackLog, add_log_arguments, get_log_from_args
+from common.ingest_queue import (
+    IngestQueue,
+    add_ingest_arguments,
+    get_ingest_queue_from_args,
+)
 
-def main(conf: zenoh.Config, key: str):
+
+def format_sample(sample: zenoh.Sample, frame: imu_codec.ImuBatch, count: int) -> str:
+    return (
+        f">> [Subscriber] Received {sample.kind} at {sample.timestamp.to_string_rfc3339_lossy()} ('{sample.key_expr}': {len(sample.payload)} bytes ({sample.encoding}), count: {count}')\n"
+        f"Decoded {len(frame.values)} samples from seq {frame.seq}: {frame.values}"
+    )
+
+
+def main(conf: zenoh.Config, key: str, log: CallbackLog, ingest: IngestQueue):
     # initiate logging
     zenoh.init_log_from_env_or("error")
     print(f"Current Config: {conf}")
@@ -26,16 +42,25 @@ def main(conf: zenoh.Config, key: str):
     print("Opening session...")
     with zenoh.open(conf) as session:
         print(f"Declaring Subscriber on '{key}'...")
-        count = 0
+
+        def consume():
+            count = 0
+            for _, sample in iter(ingest.get, None):
+                count += 1
+                try:
+                    frame = imu_codec.decode_frame_sample(sample)
+                except (ValueError, struct.error):
+                    log.event(
+                        ">> [Warning] Undecodable data ignored on '{}'", sample.key_expr
+                    )
+                    continue
+                log.sample(format_sample, sample, frame, count)
+
+        consumer = threading.Thread(target=consume, name="imu-ingest")
+        consumer.start()
 
         def listener(sample: zenoh.Sample):
-            nonlocal count
-            count += 1
-            print(
-                f">> [Subscriber] Received {sample.kind} at {sample.timestamp.to_string_rfc3339_lossy()} ('{sample.key_expr}': '{sample.payload.to_string()}, count: {count}')"
-            )
-            data = json.loads(sample.payload.to_string())
-            print(f"Json output: {data} ")
+            ingest.put(str(sample.key_expr), sample)
 
         advanced_sub = declare_advanced_subscriber(
             session,
@@ -47,13 +72,26 @@ def main(conf: zenoh.Config, key: str):
         )
 
         def miss_listener(miss: Miss):
-            print(f">> [Subscriber] Missed {miss.nb} samples from {miss.source} !!!")
+            log.event(
+                ">> [Subscriber] Missed {} samples from {} !!!", miss.nb, miss.source
+            )
 
         advanced_sub.sample_miss_listener(miss_listener)
 
         print("Press CTRL-C to quit...")
-        while True:
-            time.sleep(1)
+        reported_drops = 0
+        try:
+            while True:
+                time.sleep(1)
+                if ingest.dropped - reported_drops >= 100:
+                    reported_drops = ingest.dropped
+                    log.event(">> [Warning] Ingest queue {}", ingest.format_stats())
+        finally:
+            advanced_sub.undeclare()
+            ingest.close()
+            consumer.join()
+            log.event(">> [Subscriber] Ingest queue {}", ingest.format_stats())
+            log.close()
 
 
 # --- Command line argument parsing --- --- --- --- --- ---
@@ -73,6 +111,8 @@ if __name__ == "__main__":
         prog="z_imu_sub", description="imu subscription from firebeetle"
     )
     common.add_config_arguments(parser)
+    add_log_arguments(parser)
+    add_ingest_arguments(parser)
     parser.add_argument(
         "--key",
         "-k",
@@ -85,4 +125,4 @@ if __name__ == "__main__":
     args = parser.parse_args()
     conf = common.get_config_from_args(args)
 
-    main(conf, args.key)
+    main(conf, args.key, get_log_from_args(args), get_ingest_queue_from_args(args))
@@ -1,4 +1,7 @@
+import os
+import select
 import sys
+import threading
 import tty
 import termios
 import zenoh
@@ -8,62 +11,86 @@ import itertools
 from zenoh.ext import CacheConfig, MissDetectionConfig, declare_advanced_publisher
 
 
-def get_char():
-    """Reads a single character from the terminal without pressing Enter."""
-    fd = sys.stdin.fileno()
-    old_settings = termios.tcgetattr(fd)
-    try:
-        tty.setraw(sys.stdin.fileno())
-        ch = sys.stdin.read(1)
-    finally:
-        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-    return ch
+def get_char(timeout: float):
+    """Reads a single character from the terminal without pressing Enter.
 
+    Returns None if no key was pressed within `timeout` seconds.
+    """
+    fd = sys.stdin.fileno()
+    ready, _, _ = select.select([fd], [], [], timeout)
+    # Read the fd directly, the buffered stdin could hold keys select misses
+    return os.read(fd, 1).decode(errors="replace") if ready else None
+
+
+def serve(
+    session: zenoh.Session,
+    stop: threading.Event,
+    key: str = "computer/action1",
+    history: int = 1,
+):
+    """Publishes a dummy action per key press until 'q'/ESC or `stop` is set.
+
+    Quitting from the keyboard sets `stop`, so other roles sharing the
+    session shut down with it.
+    """
+    print(f"Declaring AdvancedPublisher on '{key}'...")
+
+    # Configure the publisher
+    pub = declare_advanced_publisher(
+        session,
+        key,
+        cache=CacheConfig(max_samples=history),
+        sample_miss_detection=MissDetectionConfig(heartbeat=5),
+        publisher_detection=True,
+    )
 
-def main(conf: zenoh.Config, key: str, history: int):
-    zenoh.init_log_from_env_or("error")
+    counter = itertools.count()
 
-    print("Opening session...")
-    with zenoh.open(conf) as session:
-        print(f"Declaring AdvancedPublisher on '{key}'...")
+    print("\n--- Relay Active ---")
+    print("TAP ANY KEY to publish a dummy packet.")
+    print("Press 'q' or 'ESC' to exit.\n")
 
-        # Configure the publisher
-        pub = declare_advanced_publisher(
-            session,
-            key,
-            cache=CacheConfig(max_samples=history),
-            sample_miss_detection=MissDetectionConfig(heartbeat=5),
-            publisher_detection=True,
-        )
+    # cbreak rather than raw mode keeps output from other roles readable
+    # and CTRL-C delivered as a signal
+    fd = sys.stdin.fileno()
+    old_settings = termios.tcgetattr(fd)
+    tty.setcbreak(fd)
+    try:
+        while not stop.is_set():
+            char = get_char(0.5)
+            if char is None:
+                continue
 
-        counter = itertools.count()
+            if char == "q" or char == "\x1b":
+                print("\nExiting...")
+                stop.set()
+                break
 
-        print("\n--- Relay Active ---")
-        print("TAP ANY KEY to publish a dummy packet.")
-        print("Press 'q' or 'ESC' to exit.\n")
+            idx = next(counter)
 
-        try:
-            while True:
-                char = get_char()
+            data = {
+                "action": round(random.uniform(0, 10)),
+                "key_pressed": char,  # Debugging help
+            }
 
-                if char == "q" or char == "\x1b" or char == "\x03":
-                    print("\nExiting...")
-                    break
+            payload = json.dumps(data).encode("utf-8")
+            pub.put(payload)
 
-                idx = next(counter)
+            print(f"[{idx}] Sent Action {data['action']} (Key: '{char}')")
 
-                data = {
-                    "action": round(random.uniform(0, 10)),
-                    "key_pressed": char,  # Debugging help
-                }
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+        pub.undeclare()
 
-                payload = json.dumps(data).encode("utf-8")
-                pub.put(payload)
 
-                print(f"[{idx}] Sent Action {data['action']} (Key: '{char}')")
+def main(conf: zenoh.Config, key: str, history: int):
+    zenoh.init_log_from_env_or("error")
 
-        except KeyboardInterrupt:
-            print("\nStopped by user.")
+    print("Opening session...")
+    with zenoh.open(conf) as session:
+        serve(session, threading.Event(), key, history)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+#
+# Copyright (c) 2022 ZettaScale Technology
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors:
+#   ZettaScale Zenoh Team, <zenoh@zettascale.tech>
+#
+import csv
+import json
+import queue
+import struct
+import time
+from typing import List, Optional
+
+import numpy as np
+import zenoh
+
+from common.latency import PERCENTILES, format_us
+from z_pong import PING_KEY, PONG_KEY, declare_pong
+
+SEQ = struct.Struct("<Q")  # Each ping starts with its sequence number
+
+DEFAULT_SIZES = [8, 64, 1024, 16384, 65536]
+
+
+def loopback_configs(endpoint: str):
+    """Two peer configs talking directly over `endpoint`, pong side listening."""
+    pong_conf = zenoh.Config()
+    ping_conf = zenoh.Config()
+    for conf in (pong_conf, ping_conf):
+        conf.insert_json5("mode", json.dumps("peer"))
+        conf.insert_json5("scouting/multicast/enabled", json.dumps(False))
+    pong_conf.insert_json5("listen/endpoints", json.dumps([endpoint]))
+    ping_conf.insert_json5("connect/endpoints", json.dumps([endpoint]))
+    return ping_conf, pong_conf
+
+
+def ping(
+    pub: zenoh.Publisher,
+    pongs: queue.SimpleQueue,
+    payload: bytearray,
+    seq: int,
+    timeout: float,
+) -> Optional[int]:
+    """Sends one ping and returns its RTT in microseconds, or None if lost."""
+    SEQ.pack_into(payload, 0, seq)
+    start = time.perf_counter_ns()
+    pub.put(bytes(payload))
+    deadline = start + int(timeout * 1e9)
+    while True:
+        remaining = (deadline - time.perf_counter_ns()) / 1e9
+        if remaining <= 0:
+            return None
+        try:
+            received_ns, pong_seq = pongs.get(timeout=remaining)
+        except queue.Empty:
+            return None
+        # Late pongs from an earlier timed-out ping are skipped
+        if pong_seq == seq:
+            return (received_ns - start) // 1000
+
+
+def summarize(size: int, rtts: np.ndarray, lost: int) -> str:
+    if not len(rtts):
+        return f"{size:>8} B  lost all {lost} pings"
+    values = np.percentile(rtts, PERCENTILES, method="higher")
+    parts = [f"p{p:g}={format_us(int(v))}" for p, v in zip(PERCENTILES, values)]
+    parts.append(f"max={format_us(int(rtts.max()))}")
+    parts.append(f"mean={format_us(int(rtts.mean()))}")
+    if lost:
+        parts.append(f"lost={lost}")
+    return f"{size:>8} B  " + "  ".join(parts)
+
+
+def main(
+    conf: zenoh.Config,
+    sizes: List[int],
+    samples: int,
+    warmup: float,
+    timeout: float,
+    express: bool,
+    csv_path: Optional[str],
+    loopback: Optional[str],
+):
+    # initiate logging
+    zenoh.init_log_from_env_or("error")
+
+    pong_session = None
+    if loopback is not None:
+        conf, pong_conf = loopback_configs(loopback)
+        print(f"Opening loopback pong session on '{loopback}'...")
+        pong_session = zenoh.open(pong_conf)
+        declare_pong(pong_session, express)
+
+    print("Opening session...")
+    with zenoh.open(conf) as session:
+        pongs = queue.SimpleQueue()
+        session.declare_subscriber(
+            PONG_KEY,
+            lambda sample: pongs.put(
+                (time.perf_counter_ns(), SEQ.unpack_from(sample.payload.to_bytes())[0])
+            ),
+        )
+        pub = session.declare_publisher(
+            PING_KEY, congestion_control=zenoh.CongestionControl.BLOCK, express=express
+        )
+
+        print(f"Waiting for a pong on '{PING_KEY}'...")
+        while not pub.matching_status.matching:
+            time.sleep(0.1)
+
+        results = []
+        seq = 0
+        for size in sizes:
+            payload = bytearray(max(size, SEQ.size))
+
+            warmup_end = time.monotonic() + warmup
+            while time.monotonic() < warmup_end:
+                ping(pub, pongs, payload, seq, timeout)
+                seq += 1
+
+            rtts = []
+            lost = 0
+            for iteration in range(samples):
+                rtt = ping(pub, pongs, payload, seq, timeout)
+                seq += 1
+                if rtt is None:
+                    lost += 1
+                else:
+                    rtts.append(rtt)
+                    results.append((len(payload), iteration, rtt))
+            print(summarize(len(payload), np.array(rtts), lost))
+
+    if pong_session is not None:
+        pong_session.close()
+
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["payload_size", "iteration", "rtt_us"])
+            writer.writerows(results)
+        print(f"RTTs written to {csv_path}")
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(prog="z_ping", description="zenoh ping example")
+    common.add_config_arguments(parser)
+    parser.add_argument(
+        "--size",
+        "-s",
+        dest="sizes",
+        action="append",
+        type=int,
+        help=f"Payload size in bytes, may be repeated (default: {DEFAULT_SIZES}).",
+    )
+    parser.add_argument(
+        "--samples",
+        "-n",
+        default=100,
+        type=int,
+        help="Measured pings per payload size.",
+    )
+    parser.add_argument(
+        "--warmup",
+        "-w",
+        default=1.0,
+        type=float,
+        help="Seconds of unmeasured pings before each payload size.",
+    )
+    parser.add_argument(
+        "--timeout",
+        default=1.0,
+        type=float,
+        help="Seconds to wait for a pong before counting the ping as lost.",
+    )
+    parser.add_argument(
+        "--no-express",
+        dest="express",
+        default=True,
+        action="store_false",
+        help="Let zenoh batch the ping messages instead of sending them immediately.",
+    )
+    parser.add_argument(
+        "--csv",
+        dest="csv_path",
+        type=str,
+        help="Write every measured RTT to this CSV.",
+    )
+    parser.add_argument(
+        "--loopback",
+        metavar="ENDPOINT",
+        type=str,
+        help="Run the pong in-process on a second peer session listening on "
+        "ENDPOINT (e.g. tcp/127.0.0.1:7448). Other config arguments are ignored.",
+    )
+
+    args = parser.parse_args()
+    main(
+        common.get_config_from_args(args),
+        args.sizes or DEFAULT_SIZES,
+        args.samples,
+        args.warmup,
+        args.timeout,
+        args.express,
+        args.csv_path,
+        args.loopback,
+    )
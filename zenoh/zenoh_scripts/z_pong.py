@@ -0,0 +1,64 @@
+#
+# Copyright (c) 2022 ZettaScale Technology
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors:
+#   ZettaScale Zenoh Team, <zenoh@zettascale.tech>
+#
+import time
+
+import zenoh
+
+PING_KEY = "bench/ping"
+PONG_KEY = "bench/pong"
+
+
+def declare_pong(session: zenoh.Session, express: bool) -> zenoh.Subscriber:
+    """Echoes every ping payload back on `PONG_KEY` from the subscriber callback."""
+    pub = session.declare_publisher(
+        PONG_KEY, congestion_control=zenoh.CongestionControl.BLOCK, express=express
+    )
+    return session.declare_subscriber(PING_KEY, lambda sample: pub.put(sample.payload))
+
+
+def main(conf: zenoh.Config, express: bool):
+    # initiate logging
+    zenoh.init_log_from_env_or("error")
+
+    print("Opening session...")
+    with zenoh.open(conf) as session:
+        print(f"Echoing '{PING_KEY}' onto '{PONG_KEY}'...")
+        declare_pong(session, express)
+
+        print("Press CTRL-C to quit...")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(prog="z_pong", description="zenoh pong example")
+    common.add_config_arguments(parser)
+    parser.add_argument(
+        "--no-express",
+        dest="express",
+        default=True,
+        action="store_false",
+        help="Let zenoh batch the pong messages instead of sending them immediately.",
+    )
+
+    args = parser.parse_args()
+    main(common.get_config_from_args(args), args.express)
@@ -16,6 +16,8 @@ from typing import Optional
 
 import zenoh
 
+from common.latency import send_time_attachment
+
 
 def main(
     conf: zenoh.Config,
@@ -24,6 +26,7 @@ def main(
     iter: Optional[int],
     interval: int,
     add_matching_listener: bool,
+    embed_send_time: bool = False,
 ):
     # initiate logging
     zenoh.init_log_from_env_or("error")
@@ -49,7 +52,9 @@ def main(
             time.sleep(interval)
             buf = f"[{idx:4d}] {payload}{idx:4d}"
             print(f"Putting Data ('{key}': '{buf}')...")
-            pub.put(buf)
+            # z_sub_thr measures latency from it instead of the HLC timestamp
+            attachment = send_time_attachment() if embed_send_time else None
+            pub.put(buf, attachment=attachment)
 
 
 # --- Command line argument parsing --- --- --- --- --- ---
@@ -100,6 +105,12 @@ if __name__ == "__main__":
         action="store_true",
         help="Add matching listener",
     )
+    parser.add_argument(
+        "--embed-send-time",
+        default=False,
+        action="store_true",
+        help="Attach the send time to each sample, for latency measurements.",
+    )
 
     args = parser.parse_args()
     conf = common.get_config_from_args(args)
@@ -111,4 +122,5 @@ if __name__ == "__main__":
         args.iter,
         args.interval,
         args.add_matching_listener,
+        args.embed_send_time,
     )
@@ -4,12 +4,15 @@ import itertools
 import zenoh
 from typing import Optional
 
+from common.callback_log import CallbackLog, add_log_arguments, get_log_from_args
+
 
 def main(
     conf: zenoh.Config,
     repub_key: str,
     sub_key: str,
     add_matching_listener: bool,
+    log: CallbackLog,
 ):
     # initiate logging
     zenoh.init_log_from_env_or("error")
@@ -36,7 +39,9 @@ def main(
             original_data = sample.payload.to_string()
             new_payload = f"TESTING REPUB: {original_data}"
 
-            print(f">> [Relay] {sample.key_expr} -> {repub_key}: {new_payload}")
+            log.sample(
+                ">> [Relay] {} -> {}: {}", sample.key_expr, repub_key, new_payload
+            )
 
             # Re-publish the data to the new key
             pub.put(new_payload)
@@ -51,6 +56,8 @@ def main(
                 time.sleep(1)
         except KeyboardInterrupt:
             print("\nShutting down...")
+        finally:
+            log.close()
 
 
 if __name__ == "__main__":
@@ -64,12 +71,13 @@ if __name__ == "__main__":
     if _repo_root not in sys.path:
         sys.path.insert(0, _repo_root)
 
-    import examples.common as common
+    import zenoh_scripts.common as common
 
     parser = argparse.ArgumentParser(
         prog="z_pub_sub", description="zenoh pub_sub example"
     )
     common.add_config_arguments(parser)
+    add_log_arguments(parser)
 
     parser.add_argument(
         "--key",
@@ -101,4 +109,5 @@ if __name__ == "__main__":
         args.repub_key,
         args.sub_key,
         args.add_matching_listener,
+        get_log_from_args(args),
     )
@@ -0,0 +1,74 @@
+import time
+from pathlib import Path
+
+import zenoh
+
+from common.sample_log import SegmentWriter
+
+
+def main(conf: zenoh.Config, key: str, directory: str, segment_size: int):
+    zenoh.init_log_from_env_or("error")
+    print(f"Current Config: {conf}")
+
+    writer = SegmentWriter(Path(directory), segment_size)
+
+    print("Opening session...")
+    with zenoh.open(conf) as session:
+
+        def listener(sample: zenoh.Sample):
+            writer.append_sample(sample, time.time_ns())
+
+        print(f"Recording '{key}' into '{directory}'...")
+        session.declare_subscriber(key, listener)
+
+        print("Press CTRL-C to quit...")
+        try:
+            while True:
+                time.sleep(1)
+                writer.flush()
+                print(f">> [Recorder] {writer.records} samples, {writer.bytes} bytes")
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+        finally:
+            writer.close()
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(
+        prog="z_record", description="Record samples into a segmented log"
+    )
+    common.add_config_arguments(parser)
+    parser.add_argument(
+        "--key",
+        "-k",
+        default="esp/**",
+        type=str,
+        help="The key expression to record.",
+    )
+    parser.add_argument(
+        "--dir",
+        "-d",
+        dest="directory",
+        default=time.strftime("recordings/%Y%m%d-%H%M%S"),
+        type=str,
+        help="Recording directory; new segments are appended to an existing one.",
+    )
+    parser.add_argument(
+        "--segment-size",
+        default=64,
+        type=int,
+        help="Start a new segment after this many MB.",
+    )
+
+    args = parser.parse_args()
+    main(
+        common.get_config_from_args(args),
+        args.key,
+        args.directory,
+        args.segment_size * 1024 * 1024,
+    )
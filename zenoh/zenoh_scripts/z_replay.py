@@ -0,0 +1,112 @@
+import time
+from pathlib import Path
+from typing import Dict
+
+import zenoh
+
+from common.sample_log import first_time_ns, read_recording, segment_paths
+
+
+def replay(
+    session: zenoh.Session,
+    directory: Path,
+    speed: float,
+    skip: float,
+    publishers: Dict[str, zenoh.Publisher],
+) -> int:
+    """Re-publishes a recording once, returns the number of samples sent."""
+    segments = segment_paths(directory)
+    origin_ns = first_time_ns(segments[0]) if segments else None
+    if origin_ns is None:
+        return 0
+    start_ns = origin_ns + int(skip * 1e9) if skip > 0 else None
+
+    sent = 0
+    wall_start = None
+    first_ns = None
+    for record in read_recording(directory, start_ns):
+        if wall_start is None:
+            wall_start = time.monotonic()
+            first_ns = record.time_ns
+        if speed > 0:
+            # Schedule against the recording's clock, so delays do not add up
+            due = wall_start + (record.time_ns - first_ns) / 1e9 / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        pub = publishers.get(record.key)
+        if pub is None:
+            pub = publishers[record.key] = session.declare_publisher(record.key)
+        pub.put(record.payload, encoding=zenoh.Encoding(record.encoding))
+        sent += 1
+    return sent
+
+
+def main(
+    conf: zenoh.Config,
+    directory: str,
+    speed: float,
+    skip: float,
+    loop: bool,
+):
+    zenoh.init_log_from_env_or("error")
+    print(f"Current Config: {conf}")
+
+    print("Opening session...")
+    with zenoh.open(conf) as session:
+        publishers: Dict[str, zenoh.Publisher] = {}
+        rate = f"{speed:g}x" if speed > 0 else "as fast as possible"
+        print(f"Replaying '{directory}' at {rate}. Press CTRL-C to quit...")
+        try:
+            while True:
+                start = time.monotonic()
+                sent = replay(session, Path(directory), speed, skip, publishers)
+                elapsed = time.monotonic() - start
+                print(
+                    f">> [Replayer] Sent {sent} samples on {len(publishers)} keys in {elapsed:.2f}s"
+                )
+                if not loop or not sent:
+                    break
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(
+        prog="z_replay", description="Replay a z_record recording"
+    )
+    common.add_config_arguments(parser)
+    parser.add_argument(
+        "--dir", "-d", dest="directory", required=True, help="Recording directory."
+    )
+    parser.add_argument(
+        "--speed",
+        "-x",
+        default=1.0,
+        type=float,
+        help="Playback speed relative to the recording, 0 for as fast as possible.",
+    )
+    parser.add_argument(
+        "--skip",
+        default=0.0,
+        type=float,
+        help="Start this many seconds into the recording.",
+    )
+    parser.add_argument(
+        "--loop", action="store_true", help="Start over at the end of the recording."
+    )
+
+    args = parser.parse_args()
+    main(
+        common.get_config_from_args(args),
+        args.directory,
+        args.speed,
+        args.skip,
+        args.loop,
+    )
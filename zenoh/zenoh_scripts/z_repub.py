@@ -1,97 +1,411 @@
-import time
+import asyncio
+import multiprocessing
+import signal
+import threading
+import zlib
 import zenoh
 from zenoh import ZBytes
 from zenoh.ext import HistoryConfig, Miss, RecoveryConfig, declare_advanced_subscriber
-import threading
-from typing import List
+import struct
+from typing import Callable, Dict, Optional
 import json
 
+from common import imu_codec
+from common.callback_log import CallbackLog, add_log_arguments, get_log_from_args
+from common.flush_scheduler import FlushScheduler
+from common.ingest_queue import IngestQueue, add_ingest_arguments
+from common.ring_window import RingWindow
 
-def main(
-    conf: zenoh.Config,
+
+def format_sample(sample: zenoh.Sample, frame: imu_codec.ImuBatch) -> str:
+    return (
+        f">> [Subscriber] Received {sample.kind} at {sample.timestamp.to_string_rfc3339_lossy()} ('{sample.key_expr}': {len(sample.payload)} bytes ({sample.encoding}))\n"
+        f"Received: {frame.action.tolist()}"
+    )
+
+
+class Averager:
+    """Averages the actions of each source over tumbling or sliding windows.
+
+    Holds one preallocated window per source key and its flush schedule. All
+    methods run on `loop`, so no lock is needed; `publish` receives the JSON
+    of each emitted window.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        interval: float,
+        flush_count: int,
+        window: int,
+        sliding: bool,
+        publish: Callable[[str], None],
+        log: CallbackLog,
+    ):
+        self.window = window
+        self.sliding = sliding
+        self.publish = publish
+        self.log = log
+        self.windows: Dict[str, RingWindow] = {}
+        self.scheduler = FlushScheduler(loop, interval, flush_count, self.emit)
+
+    def emit(self, source: str):
+        ring = self.windows[source]
+        avg_val = int(ring.total // ring.size)
+        data = {
+            "action": avg_val,
+            "source": source,
+            "count": ring.size,
+            "min": ring.minimum,
+            "max": ring.maximum,
+        }
+        self.publish(json.dumps(data))
+        self.log.event(
+            ">> [Repub] To Visualizer: average action of {} after({} samples): {:.2f}",
+            source,
+            ring.size,
+            avg_val,
+        )
+        if ring.overwritten and not self.sliding:
+            self.log.event(
+                ">> [Warning] {} samples from {} overflowed the window",
+                ring.overwritten,
+                source,
+            )
+        if not self.sliding:
+            ring.reset()  # Start the next tumbling window
+
+    def on_frame(self, source: str, actions):
+        ring = self.windows.get(source)
+        if ring is None:
+            ring = self.windows[source] = RingWindow(self.window)
+        elif not self.sliding and ring.size + len(actions) > ring.capacity:
+            self.scheduler.flush(source)  # Emit early rather than overwrite
+        ring.push(actions)
+        self.scheduler.add(source, len(actions))
+
+    def close(self):
+        self.scheduler.close()
+
+
+def shard_of(key: str, shards: int) -> int:
+    """Stable across processes and runs, unlike `hash()` on a str."""
+    return zlib.crc32(key.encode()) % shards
+
+
+async def run_shard(
+    shard: int,
+    samples: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    interval: float,
+    flush_count: int,
+    window: int,
+    sliding: bool,
+    log: CallbackLog,
+):
+    loop = asyncio.get_running_loop()
+    averager = Averager(loop, interval, flush_count, window, sliding, results.put, log)
+    done = asyncio.Event()
+
+    def reader():
+        # `None` is the coordinator's stop sentinel
+        for key, payload in iter(samples.get, None):
+            try:
+                frame = imu_codec.decode_frame(payload)
+            except (ValueError, struct.error):
+                log.event(">> [Warning] Undecodable data ignored: {!r}", payload)
+                continue
+            loop.call_soon_threadsafe(averager.on_frame, key, frame.action)
+            log.sample(
+                ">> [Shard {}] Received {} samples from '{}': {}",
+                shard,
+                len(frame.action),
+                key,
+                frame.action.tolist(),
+            )
+        loop.call_soon_threadsafe(done.set)
+
+    threading.Thread(target=reader, name=f"shard-{shard}", daemon=True).start()
+    await done.wait()
+    averager.close()
+
+
+def shard_main(
+    shard: int,
+    samples: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    interval: float,
+    flush_count: int,
+    window: int,
+    sliding: bool,
+    every: int,
+    quiet: bool,
+):
+    """Worker process entry point: averages the sources hashed to `shard`."""
+    # CTRL-C reaches the whole process group; the coordinator stops us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log = CallbackLog(every, quiet)
+    try:
+        asyncio.run(
+            run_shard(
+                shard, samples, results, interval, flush_count, window, sliding, log
+            )
+        )
+    finally:
+        log.close()
+
+
+class ShardPool:
+    """Routes samples to worker processes by source key, and publishes the
+    averages they send back.
+
+    The zenoh callback only hashes the key and enqueues the raw payload;
+    decoding and aggregation run in the workers, each owning the windows of
+    its own sources, so the load spreads over `shards` cores.
+    """
+
+    def __init__(
+        self,
+        pub: zenoh.Publisher,
+        shards: int,
+        interval: float,
+        flush_count: int,
+        window: int,
+        sliding: bool,
+        log: CallbackLog,
+        queue_size: int = 4096,
+    ):
+        # Spawned rather than forked, so workers do not inherit the session
+        context = multiprocessing.get_context("spawn")
+        self.pub = pub
+        self.results = context.Queue()
+        self.queues = [context.Queue(queue_size) for _ in range(shards)]
+        self.workers = [
+            context.Process(
+                target=shard_main,
+                args=(
+                    shard,
+                    queue,
+                    self.results,
+                    interval,
+                    flush_count,
+                    window,
+                    sliding,
+                    log.every,
+                    log.quiet,
+                ),
+                name=f"repub-shard-{shard}",
+                daemon=True,
+            )
+            for shard, queue in enumerate(self.queues)
+        ]
+        for worker in self.workers:
+            worker.start()
+        self.forwarder = threading.Thread(target=self._forward, name="shard-results")
+        self.forwarder.start()
+
+    def _forward(self):
+        for payload in iter(self.results.get, None):
+            self.pub.put(ZBytes(payload))
+
+    def put(self, sample: zenoh.Sample):
+        key = str(sample.key_expr)
+        self.queues[shard_of(key, len(self.queues))].put(
+            (key, sample.payload.to_bytes())
+        )
+
+    def close(self):
+        for queue in self.queues:
+            queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.results.put(None)
+        self.forwarder.join()
+
+
+async def run(
+    session: zenoh.Session,
+    stop: threading.Event,
     repub_key: str,
     sub_key: str,
     interval: float,
     add_matching_listener: bool,
+    window: int,
+    sliding: bool,
+    flush_count: int,
+    shards: int,
+    ingest: IngestQueue,
+    log: CallbackLog,
 ):
-    zenoh.init_log_from_env_or("error")
-    print(f"Current Config: {conf}")
+    loop = asyncio.get_running_loop()
 
-    # State for averaging
-    data_buffer: List[float] = []
-    buffer_lock = threading.Lock()
+    # 1. Setup Publisher
+    print(f"Declaring Publisher on '{repub_key}'...")
+    pub = session.declare_publisher(repub_key)
 
-    print("Opening session...")
-    with zenoh.open(conf) as session:
-
-        # 1. Setup Publisher
-        print(f"Declaring Publisher on '{repub_key}'...")
-        pub = session.declare_publisher(repub_key)
+    if add_matching_listener:
 
-        if add_matching_listener:
+        def on_matching_status_update(status: zenoh.MatchingStatus):
+            state = "has" if status.matching else "has NO MORE"
+            print(f"Publisher {state} matching subscribers.")
 
-            def on_matching_status_update(status: zenoh.MatchingStatus):
-                state = "has" if status.matching else "has NO MORE"
-                print(f"Publisher {state} matching subscribers.")
+        pub.declare_matching_listener(on_matching_status_update)
 
-            pub.declare_matching_listener(on_matching_status_update)
+    if shards > 1:
+        print(f"Starting {shards} shard workers...")
+        aggregator = ShardPool(pub, shards, interval, flush_count, window, sliding, log)
+        process = aggregator.put
+    else:
+        aggregator = Averager(
+            loop,
+            interval,
+            flush_count,
+            window,
+            sliding,
+            lambda payload: pub.put(ZBytes(payload)),
+            log,
+        )
 
-        def republish_callback(sample: zenoh.Sample):
+        def process(sample: zenoh.Sample):
             try:
-                print(
-                    f">> [Subscriber] Received {sample.kind} at {sample.timestamp.to_string_rfc3339_lossy()} ('{sample.key_expr}': '{sample.payload.to_string()}')"
+                frame = imu_codec.decode_frame_sample(sample)
+                loop.call_soon_threadsafe(
+                    aggregator.on_frame, str(sample.key_expr), frame.action
                 )
-                msg = json.loads(sample.payload.to_string())
-                print(msg)
-                val = msg["action"]
-                with buffer_lock:
-                    data_buffer.append(val)
-                print(f"Received: {val}")
-            except ValueError:
-                print(
-                    f">> [Warning] Non-numeric data ignored: {sample.payload.to_string()}"
+                log.sample(format_sample, sample, frame)
+            except (ValueError, struct.error):
+                log.event(
+                    ">> [Warning] Undecodable data ignored: {!r}",
+                    sample.payload.to_bytes(),
                 )
 
-        print(f"Declaring Subscriber on '{sub_key}'...")
-        sub = declare_advanced_subscriber(
+    # The callback only enqueues; decoding and routing run on the consumer
+    def consume():
+        reported_drops = 0
+        for _, sample in iter(ingest.get, None):
+            process(sample)
+            if ingest.dropped - reported_drops >= 100:
+                reported_drops = ingest.dropped
+                log.event(">> [Warning] Ingest queue {}", ingest.format_stats())
+
+    consumer = threading.Thread(target=consume, name="repub-ingest")
+    consumer.start()
+
+    def republish_callback(sample: zenoh.Sample):
+        ingest.put(str(sample.key_expr), sample)
+
+    print(f"Declaring Subscriber on '{sub_key}'...")
+    sub = declare_advanced_subscriber(
+        session,
+        sub_key,
+        republish_callback,
+        history=HistoryConfig(detect_late_publishers=True),
+        recovery=RecoveryConfig(heartbeat=True),
+        subscriber_detection=True,
+    )
+
+    def miss_listener(miss: Miss):
+        log.event(">> [Subscriber] Missed {} samples from {} !!!", miss.nb, miss.source)
+
+    sub.sample_miss_listener(miss_listener)
+
+    mode = f"sliding over the last {window}" if sliding else "tumbling"
+    print(
+        f"Averaging every {flush_count} samples or {interval}s ({mode}). Press CTRL-C to quit..."
+    )
+    stopped = asyncio.Event()
+
+    def wait_for_stop():
+        stop.wait()
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(stopped.set)
+
+    threading.Thread(target=wait_for_stop, name="repub-stop", daemon=True).start()
+    try:
+        await stopped.wait()
+    finally:
+        sub.undeclare()
+        ingest.close()
+        consumer.join()
+        await asyncio.sleep(0)  # Run the frames the consumer handed over last
+        aggregator.close()
+        pub.undeclare()
+        log.event(">> [Repub] Ingest queue {}", ingest.format_stats())
+
+
+def serve(
+    session: zenoh.Session,
+    stop: threading.Event,
+    log: CallbackLog,
+    repub_key: str = "ultra/action1",
+    sub_key: str = "esp/**",
+    interval: float = 5.0,
+    add_matching_listener: bool = False,
+    window: int = 256,
+    sliding: bool = False,
+    flush_count: Optional[int] = None,
+    shards: int = 1,
+    queue_size: int = 1024,
+    overload: str = "drop-oldest",
+):
+    """Runs the republisher on its own event loop until `stop` is set."""
+    asyncio.run(
+        run(
             session,
+            stop,
+            repub_key,
             sub_key,
-            republish_callback,
-            history=HistoryConfig(detect_late_publishers=True),
-            recovery=RecoveryConfig(heartbeat=True),
-            subscriber_detection=True,
+            interval,
+            add_matching_listener,
+            window,
+            sliding,
+            flush_count or window,
+            shards,
+            IngestQueue(queue_size, overload),
+            log,
         )
+    )
 
-        def miss_listener(miss: Miss):
-            print(f">> [Subscriber] Missed {miss.nb} samples from {miss.source} !!!")
-
-        sub.sample_miss_listener(miss_listener)
-
-        print(f"Averaging every {interval}s. Press CTRL-C to quit...")
-        try:
-            while True:
-                time.sleep(interval)
-
-                with buffer_lock:
-                    if data_buffer:
-                        avg_val = sum(data_buffer) // len(data_buffer)
-                        data = {
-                            "action": avg_val,
-                        }
-                        payload_string = json.dumps(data)
-                        payload_bytes = ZBytes(payload_string)
-                        pub.put(payload_bytes)
-                        count = len(data_buffer)
-                        print(
-                            f">> [Repub] To Visualizer: average action after({count} samples): {avg_val:.2f}"
-                        )
-                        data_buffer.clear()  # Clear queue for next window
-                    else:
-                        # Optional: Print if no data arrived in the window
-                        pass
-
-        except KeyboardInterrupt:
-            print("\nShutting down...")
+
+def main(
+    conf: zenoh.Config,
+    repub_key: str,
+    sub_key: str,
+    interval: float,
+    add_matching_listener: bool,
+    window: int,
+    sliding: bool,
+    flush_count: Optional[int],
+    shards: int,
+    queue_size: int,
+    overload: str,
+    log: CallbackLog,
+):
+    zenoh.init_log_from_env_or("error")
+    print(f"Current Config: {conf}")
+
+    print("Opening session...")
+    try:
+        with zenoh.open(conf) as session:
+            serve(
+                session,
+                threading.Event(),
+                log,
+                repub_key,
+                sub_key,
+                interval,
+                add_matching_listener,
+                window,
+                sliding,
+                flush_count,
+                shards,
+                queue_size,
+                overload,
+            )
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        log.close()
 
 
 if __name__ == "__main__":
@@ -107,6 +421,8 @@ if __name__ == "__main__":
 
     if common:
         common.add_config_arguments(parser)
+    add_log_arguments(parser)
+    add_ingest_arguments(parser)
 
     parser.add_argument(
         "--key",
@@ -119,13 +435,56 @@ if __name__ == "__main__":
         "--sub-key", "-s", default="esp/**", help="Key to subscribe to."
     )
     parser.add_argument(
-        "--interval", "-i", type=float, default=5.0, help="Window interval in seconds."
+        "--interval",
+        "-i",
+        type=float,
+        default=5.0,
+        help="Deadline in seconds after a window's first sample.",
+    )
+    parser.add_argument(
+        "--count",
+        "-n",
+        dest="flush_count",
+        type=int,
+        help="Emit a window once this many samples arrived (default: --window).",
     )
     parser.add_argument(
         "--add-matching-listener", action="store_true", help="Add matching listener"
     )
+    parser.add_argument(
+        "--window",
+        "-w",
+        type=int,
+        default=256,
+        help="Samples kept per source; the span of a sliding window.",
+    )
+    parser.add_argument(
+        "--sliding",
+        action="store_true",
+        help="Emit over the last --window samples instead of tumbling windows.",
+    )
+
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Worker processes to spread sources over (1: average in-process).",
+    )
 
     args = parser.parse_args()
     conf = common.get_config_from_args(args) if common else zenoh.Config()
 
-    main(conf, args.repub_key, args.sub_key, args.interval, args.add_matching_listener)
+    main(
+        conf,
+        args.repub_key,
+        args.sub_key,
+        args.interval,
+        args.add_matching_listener,
+        args.window,
+        args.sliding,
+        args.flush_count,
+        args.shards,
+        args.queue_size,
+        args.overload,
+        get_log_from_args(args),
+    )
@@ -0,0 +1,169 @@
+"""Runs several roles in one process over a single shared zenoh session.
+
+Each role is the `serve` function of the matching script, run in its own
+thread until CTRL-C, the keyboard role's 'q', or a role failing. Roles come
+from `--role` (script defaults) or from a YAML file with per-role options:
+
+    roles:
+      - role: queryable
+      - role: repub
+        window: 64
+        sliding: true
+      - monitor
+
+Option names are the keyword arguments of the role's `serve` function.
+"""
+
+import threading
+import traceback
+from typing import Dict, List, Tuple
+
+import zenoh
+
+import z_big_file_queryable
+import z_classifier
+import z_features
+import z_imu_history
+import z_keyboard_pub
+import z_repub
+import z_sub_thr
+from common.callback_log import CallbackLog, add_log_arguments, get_log_from_args
+
+
+def serve_queryable(session, stop, log, **options):
+    z_big_file_queryable.serve(session, stop, **options)
+
+
+def serve_keyboard(session, stop, log, **options):
+    z_keyboard_pub.serve(session, stop, **options)
+
+
+def serve_history(session, stop, log, **options):
+    z_imu_history.serve(session, stop, **options)
+
+
+ROLES = {
+    "queryable": serve_queryable,
+    "repub": z_repub.serve,
+    "monitor": z_sub_thr.serve,
+    "keyboard": serve_keyboard,
+    "history": serve_history,
+    "features": z_features.serve,
+    "classifier": z_classifier.serve,
+}
+
+RoleSpec = Tuple[str, Dict]
+
+
+def load_roles(path: str) -> List[RoleSpec]:
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("Reading a roles file requires PyYAML (pip install pyyaml)")
+
+    with open(path) as f:
+        document = yaml.safe_load(f) or {}
+    specs = []
+    for entry in document.get("roles", []):
+        if isinstance(entry, str):
+            entry = {"role": entry}
+        options = dict(entry)
+        name = options.pop("role", None)
+        specs.append((name, options))
+    return specs
+
+
+def check_roles(specs: List[RoleSpec]):
+    names = [name for name, _ in specs]
+    for name in names:
+        if name not in ROLES:
+            raise ValueError(f"Unknown role {name!r}, expected one of {list(ROLES)}")
+    if names.count("keyboard") > 1:
+        raise ValueError("Only one keyboard role can read the terminal")
+    if not names:
+        raise ValueError("No roles to run")
+
+
+def run_role(
+    name: str,
+    options: Dict,
+    session: zenoh.Session,
+    stop: threading.Event,
+    log: CallbackLog,
+):
+    try:
+        ROLES[name](session, stop, log, **options)
+    except Exception:
+        print(f"!! Role '{name}' failed, stopping all roles")
+        traceback.print_exc()
+    finally:
+        # A role returning on its own (keyboard 'q', or a failure) ends the run
+        stop.set()
+
+
+def main(conf: zenoh.Config, specs: List[RoleSpec], log: CallbackLog):
+    zenoh.init_log_from_env_or("error")
+    print(f"Current Config: {conf}")
+
+    print("Opening session...")
+    with zenoh.open(conf) as session:
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=run_role,
+                args=(name, options, session, stop, log),
+                name=f"role-{name}",
+            )
+            for name, options in specs
+        ]
+        print(f"Starting roles {[name for name, _ in specs]}...")
+        for thread in threads:
+            thread.start()
+
+        try:
+            stop.wait()
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+            stop.set()
+        for thread in threads:
+            thread.join()
+        log.close()
+
+
+# --- Command line argument parsing --- --- --- --- --- ---
+if __name__ == "__main__":
+    import argparse
+
+    import common
+
+    parser = argparse.ArgumentParser(
+        prog="z_runner", description="Run several roles over one zenoh session"
+    )
+    common.add_config_arguments(parser)
+    add_log_arguments(parser)
+    parser.add_argument(
+        "--role",
+        "-r",
+        dest="roles",
+        action="append",
+        default=[],
+        choices=list(ROLES),
+        help="Role to run with its default options, may be repeated.",
+    )
+    parser.add_argument(
+        "--roles-file",
+        "-f",
+        metavar="FILE",
+        type=str,
+        help="YAML file listing roles and their options.",
+    )
+
+    args = parser.parse_args()
+    try:
+        specs = load_roles(args.roles_file) if args.roles_file else []
+        specs += [(name, {}) for name in args.roles]
+        check_roles(specs)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    main(common.get_config_from_args(args), specs, get_log_from_args(args))
@@ -15,8 +15,14 @@ import time
 
 import zenoh
 
+from common.callback_log import CallbackLog, add_log_arguments, get_log_from_args
 
-def main(conf: zenoh.Config, key: str):
+
+def format_sample(sample: zenoh.Sample) -> str:
+    return f">> [Subscriber] Received {sample.kind} ('{sample.key_expr}': '{sample.payload.to_string()}')"
+
+
+def main(conf: zenoh.Config, key: str, log: CallbackLog):
     # initiate logging
     zenoh.init_log_from_env_or("error")
     print(f"Current Config: {conf}")
@@ -26,15 +32,16 @@ def main(conf: zenoh.Config, key: str):
         print(f"Declaring Subscriber on '{key}'...")
 
         def listener(sample: zenoh.Sample):
-            print(
-                f">> [Subscriber] Received {sample.kind} ('{sample.key_expr}': '{sample.payload.to_string()}')"
-            )
+            log.sample(format_sample, sample)
 
         session.declare_subscriber(key, listener)
 
         print("Press CTRL-C to quit...")
-        while True:
-            time.sleep(1)
+        try:
+            while True:
+                time.sleep(1)
+        finally:
+            log.close()
 
 
 # --- Command line argument parsing --- --- --- --- --- ---
@@ -52,6 +59,7 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(prog="z_sub", description="zenoh sub example")
     common.add_config_arguments(parser)
+    add_log_arguments(parser)
     parser.add_argument(
         "--key",
         "-k",
@@ -64,4 +72,4 @@ if __name__ == "__main__":
     args = parser.parse_args()
     conf = common.get_config_from_args(args)
 
-    main(conf, args.key)
+    main(conf, args.key, get_log_from_args(args))
@@ -1,8 +1,15 @@
+import queue
+import threading
 import time
-import json
+from typing import Dict, List, Optional
+
 import zenoh
 from zenoh.ext import HistoryConfig, Miss, RecoveryConfig, declare_advanced_subscriber
 
+from common import imu_codec
+from common.callback_log import CallbackLog, add_log_arguments, get_log_from_args
+from common.latency import LatencyHistogram, sample_latency_us, write_csv
+
 
 def format_bytes(size):
     """Formats bytes into a human-readable string."""
@@ -15,110 +22,245 @@ def format_bytes(size):
 
 PREFIXES = ["esp", "ultra", "computer", "phone"]
 
+# Liveliness tokens announced by publishers. Advanced publishers hide theirs
+# under an `@adv` chunk, which a plain `**` does not match.
+DISCOVERY_KEYS = ["**", "**/@adv/**"]
 
-def _new_state():
-    return {
-        "total_count": 0,
-        "total_bytes": 0,
-        "batch_count": 0,
-        "batch_bytes": 0,
-        "start_time": None,
-        "global_start": None,
-    }
 
+class PrefixStats:
+    """Counters for one prefix, updated by that prefix's subscriber.
 
-def main(conf: zenoh.Config, key: str, measure_count: int):
-    zenoh.init_log_from_env_or("error")
-    print(f"Current Config: {conf}")
+    zenoh may run one subscriber's callbacks on several threads at once, so
+    every read or update goes through `lock`.
+    """
 
-    print("Opening session...")
-    with zenoh.open(conf) as session:
-        print(f"Subscribing to '{key}'...")
+    __slots__ = (
+        "prefix",
+        "lock",
+        "total_count",
+        "total_bytes",
+        "batch_count",
+        "batch_bytes",
+        "start_time",
+        "global_start",
+        "batch_latency",
+        "total_latency",
+    )
 
-        states = {prefix: _new_state() for prefix in PREFIXES}
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.total_count = 0
+        self.total_bytes = 0
+        self.batch_count = 0
+        self.batch_bytes = 0
+        self.start_time = None
+        self.global_start = None
+        self.batch_latency = LatencyHistogram()
+        self.total_latency = LatencyHistogram()
 
-        def listener(sample: zenoh.Sample):
-            now = time.time()
-            key_str = str(sample.key_expr)
 
-            matched = next(
-                (p for p in PREFIXES if key_str == p or key_str.startswith(p + "/")),
-                None,
-            )
-            if matched is None:
-                return
-
-            state = states[matched]
-            if state["global_start"] is None:
-                state["global_start"] = now
-                state["start_time"] = now
-
-            payload_size = len(sample.payload)
-            state["total_count"] += 1
-            state["total_bytes"] += payload_size
-            state["batch_count"] += 1
-            state["batch_bytes"] += payload_size
-
-            timestamp_str = (
-                sample.timestamp.to_string_rfc3339_lossy()
-                if sample.timestamp
-                else "N/A"
-            )
-            print(
-                f">> [Subscriber] Received {sample.kind} at {timestamp_str} ('{sample.key_expr}': '{sample.payload.to_string()}')"
-            )
-            data = json.loads(sample.payload.to_string())
-            print(f"Json output: {data} ")
+def format_sample(sample: zenoh.Sample) -> str:
+    timestamp_str = (
+        sample.timestamp.to_string_rfc3339_lossy() if sample.timestamp else "N/A"
+    )
+    # Batch frames from `z_imu_pub --batch` hold several samples
+    frame = imu_codec.decode_frame_sample(sample)
+    return (
+        f">> [Subscriber] Received {sample.kind} at {timestamp_str} ('{sample.key_expr}': {len(sample.payload)} bytes ({sample.encoding}))\n"
+        f"Decoded {len(frame.values)} samples from seq {frame.seq}: {frame.values}, actions {frame.action}"
+    )
+
+
+def format_statistics(
+    prefix: str,
+    measure_count: int,
+    msg_thr: float,
+    byte_thr: float,
+    total_count: int,
+    total_bytes: int,
+    latency: Optional[str],
+) -> str:
+    lines = [
+        f"--- [{prefix}] Statistics (Last {measure_count} msgs) ---",
+        f"  Throughput: {msg_thr:.2f} msgs/s",
+        f"  Bandwidth:  {format_bytes(byte_thr)}/s",
+        f"  Total Rcvd: {total_count} msgs ({format_bytes(total_bytes)})",
+    ]
+    if latency:
+        lines.append(f"  Latency:    {latency}")
+    return "\n".join(lines)
+
+
+def make_listener(state: PrefixStats, measure_count: int, log: CallbackLog):
+    def listener(sample: zenoh.Sample):
+        now_ns = time.time_ns()
+        now = now_ns / 1e9
+        payload_size = len(sample.payload)
+        latency_us = sample_latency_us(sample, now_ns)
+        log.sample(format_sample, sample)
+
+        statistics = None
+        with state.lock:
+            if state.global_start is None:
+                state.global_start = now
+                state.start_time = now
 
-            if state["batch_count"] >= measure_count:
-                elapsed = now - state["start_time"]
+            state.total_count += 1
+            state.total_bytes += payload_size
+            state.batch_count += 1
+            state.batch_bytes += payload_size
+            if latency_us is not None:
+                state.batch_latency.record(latency_us)
+                state.total_latency.record(latency_us)
+
+            if state.batch_count >= measure_count:
+                elapsed = now - state.start_time
                 if elapsed > 0:
-                    msg_thr = state["batch_count"] / elapsed
-                    byte_thr = state["batch_bytes"] / elapsed
-
-                    print(f"--- [{matched}] Statistics (Last {measure_count} msgs) ---")
-                    print(f"  Throughput: {msg_thr:.2f} msgs/s")
-                    print(f"  Bandwidth:  {format_bytes(byte_thr)}/s")
-                    print(
-                        f"  Total Rcvd: {state['total_count']} msgs ({format_bytes(state['total_bytes'])})"
+                    statistics = (
+                        state.prefix,
+                        measure_count,
+                        state.batch_count / elapsed,
+                        state.batch_bytes / elapsed,
+                        state.total_count,
+                        state.total_bytes,
+                        (
+                            state.batch_latency.summary()
+                            if state.batch_latency.total
+                            else None
+                        ),
                     )
 
-                state["batch_count"] = 0
-                state["batch_bytes"] = 0
-                state["start_time"] = now
+                state.batch_count = 0
+                state.batch_bytes = 0
+                state.batch_latency.reset()
+                state.start_time = now
+
+        if statistics is not None:
+            log.event(format_statistics, *statistics)
+
+    return listener
+
+
+def serve(
+    session: zenoh.Session,
+    stop: threading.Event,
+    log: CallbackLog,
+    prefixes: List[str] = PREFIXES,
+    measure_count: int = 100,
+    latency_csv: Optional[str] = None,
+    dynamic: bool = False,
+):
+    """Measures each prefix on `session` until `stop` is set or CTRL-C."""
+    states: Dict[str, PrefixStats] = {}
+    subscribers = []
+
+    def miss_listener(miss: Miss):
+        log.event("!! Missed {} samples from {}", miss.nb, miss.source)
 
+    def subscribe(prefix: str):
+        # `prefix/**` also matches the bare `prefix` key
+        print(f"Subscribing to '{prefix}/**'...")
+        state = PrefixStats(prefix)
+        states[prefix] = state
         advanced_sub = declare_advanced_subscriber(
             session,
-            key,
-            listener,
+            f"{prefix}/**",
+            make_listener(state, measure_count, log),
             history=HistoryConfig(detect_late_publishers=True),
             recovery=RecoveryConfig(heartbeat=True),
             subscriber_detection=True,
         )
+        advanced_sub.sample_miss_listener(miss_listener)
+        subscribers.append(advanced_sub)
 
-        def miss_listener(miss: Miss):
-            print(f"!! Missed {miss.nb} samples from {miss.source}")
+    for prefix in prefixes:
+        subscribe(prefix)
 
-        advanced_sub.sample_miss_listener(miss_listener)
+    # Discovered prefixes are declared from the main loop rather than from
+    # the liveliness callback
+    discovered = queue.SimpleQueue()
+
+    def on_token(sample: zenoh.Sample):
+        if sample.kind == zenoh.SampleKind.PUT:
+            prefix = str(sample.key_expr).split("/", 1)[0]
+            if not prefix.startswith("@"):
+                discovered.put(prefix)
+
+    if dynamic:
+        print(f"Discovering prefixes from liveliness tokens {DISCOVERY_KEYS}...")
+        for discovery_key in DISCOVERY_KEYS:
+            subscribers.append(
+                session.liveliness().declare_subscriber(
+                    discovery_key, on_token, history=True
+                )
+            )
+
+    try:
+        while not stop.wait(0.5):
+            while not discovered.empty():
+                prefix = discovered.get()
+                if prefix not in states:
+                    subscribe(prefix)
+            now = time.time()
+            active = [s for s in states.values() if s.global_start is not None]
+            if active:
+                print(f"\n--- Average (since start) ---")
+                for state in active:
+                    with state.lock:
+                        total_count = state.total_count
+                        total_bytes = state.total_bytes
+                    total_elapsed = now - state.global_start
+                    if total_elapsed > 0:
+                        avg_throughput = total_count / total_elapsed
+                        avg_bandwidth = total_bytes / total_elapsed
+                        print(
+                            f"  [{state.prefix}] {avg_throughput:.2f} msgs/s  {format_bytes(avg_bandwidth)}/s"
+                            f"  (total: {total_count} msgs, {format_bytes(total_bytes)})"
+                        )
+    except KeyboardInterrupt:
+        pass
+
+    for subscriber in subscribers:
+        subscriber.undeclare()
+    # Queued behind any pending sample lines
+    log.event("\nShutdown initiated")
+    for prefix, state in states.items():
+        if state.total_latency.total:
+            log.event("  [{}] Latency {}", prefix, state.total_latency.summary())
+    if latency_csv:
+        write_csv(
+            latency_csv,
+            {prefix: state.total_latency for prefix, state in states.items()},
+        )
+        log.event("Latency histograms written to {}", latency_csv)
+
+
+def main(
+    conf: zenoh.Config,
+    prefixes: List[str],
+    measure_count: int,
+    latency_csv: Optional[str],
+    dynamic: bool,
+    log: CallbackLog,
+):
+    zenoh.init_log_from_env_or("error")
+    print(f"Current Config: {conf}")
+
+    print("Opening session...")
+    with zenoh.open(conf) as session:
         try:
-            while True:
-                time.sleep(0.5)
-                now = time.time()
-                active = [p for p in PREFIXES if states[p]["global_start"] is not None]
-                if active:
-                    print(f"\n--- Average (since start) ---")
-                    for prefix in active:
-                        state = states[prefix]
-                        total_elapsed = now - state["global_start"]
-                        if total_elapsed > 0:
-                            avg_throughput = state["total_count"] / total_elapsed
-                            avg_bandwidth = state["total_bytes"] / total_elapsed
-                            print(
-                                f"  [{prefix}] {avg_throughput:.2f} msgs/s  {format_bytes(avg_bandwidth)}/s"
-                                f"  (total: {state['total_count']} msgs, {format_bytes(state['total_bytes'])})"
-                            )
-        except KeyboardInterrupt:
-            print("\nShutdown initiated")
+            serve(
+                session,
+                threading.Event(),
+                log,
+                prefixes,
+                measure_count,
+                latency_csv,
+                dynamic,
+            )
+        finally:
+            log.close()
 
 
 # --- Command line argument parsing ---
@@ -131,10 +273,36 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(prog="z_imu_sub_thr")
     common.add_config_arguments(parser)
-    parser.add_argument("--key", "-k", default="**", type=str)
+    add_log_arguments(parser)
+    parser.add_argument(
+        "--prefix",
+        "-p",
+        dest="prefixes",
+        action="append",
+        type=str,
+        help=f"Top-level prefix to measure, may be repeated (default: {PREFIXES}).",
+    )
+    parser.add_argument(
+        "--dynamic",
+        "-d",
+        action="store_true",
+        help="Also subscribe to new prefixes announced through liveliness tokens.",
+    )
     parser.add_argument(
         "--number", "-n", default=100, type=int, help="Batch size for logs"
     )
+    parser.add_argument(
+        "--latency-csv",
+        type=str,
+        help="Write the per-prefix latency histograms to this CSV on exit.",
+    )
 
     args = parser.parse_args()
-    main(common.get_config_from_args(args), args.key, args.number)
+    main(
+        common.get_config_from_args(args),
+        args.prefixes or PREFIXES,
+        args.number,
+        args.latency_csv,
+        args.dynamic,
+        get_log_from_args(args),
+    )
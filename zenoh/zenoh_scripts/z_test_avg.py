@@ -1,22 +1,24 @@
-import time
+import asyncio
 import zenoh
-import threading
-from typing import List
+from typing import List, Optional
 
+from common.callback_log import CallbackLog, add_log_arguments, get_log_from_args
+from common.flush_scheduler import FlushScheduler
 
-def main(
+
+async def run(
     conf: zenoh.Config,
     repub_key: str,
     sub_key: str,
     interval: float,
     add_matching_listener: bool,
+    flush_count: Optional[int],
+    log: CallbackLog,
 ):
-    zenoh.init_log_from_env_or("error")
-    print(f"Current Config: {conf}")
+    loop = asyncio.get_running_loop()
 
-    # State for averaging
+    # State for averaging, only touched from the event loop
     data_buffer: List[float] = []
-    buffer_lock = threading.Lock()
 
     print("Opening session...")
     with zenoh.open(conf) as session:
@@ -33,45 +35,73 @@ def main(
 
             pub.declare_matching_listener(on_matching_status_update)
 
-        # 2. Setup Subscriber (The "Enqueuer")
+        # 2. The "Averager", run by the scheduler on count or deadline
+        def emit(_key: str):
+            avg_val = sum(data_buffer) / len(data_buffer)
+            count = len(data_buffer)
+            data_buffer.clear()  # Clear queue for next window
+
+            output = f"Average({count} samples): {avg_val:.2f}"
+            log.event(">> [Repub] {}", output)
+            pub.put(output)
+
+        scheduler = FlushScheduler(loop, interval, flush_count, emit)
+
+        def on_value(val: float):
+            data_buffer.append(val)
+            scheduler.add(sub_key)
+
+        # 3. Setup Subscriber (The "Enqueuer")
         def republish_callback(sample: zenoh.Sample):
             try:
                 # Should give me gibberish values
                 msg = sample.payload.to_string()
                 val = float(msg[-1])
-                with buffer_lock:
-                    data_buffer.append(val)
-                # Optional: print raw arrival for debugging
-                print(f"Received: {val}")
+                loop.call_soon_threadsafe(on_value, val)
+                log.sample("Received: {}", val)
             except ValueError:
-                print(
-                    f">> [Warning] Non-numeric data ignored: {sample.payload.to_string()}"
-                )
+                log.event(">> [Warning] Non-numeric data ignored: {}", msg)
 
         print(f"Declaring Subscriber on '{sub_key}'...")
         sub = session.declare_subscriber(sub_key, republish_callback)
 
-        # 3. Main Loop (The "Averager")
-        print(f"Averaging every {interval}s. Press CTRL-C to quit...")
+        print(
+            f"Averaging every {flush_count} samples or {interval}s. Press CTRL-C to quit..."
+        )
         try:
-            while True:
-                time.sleep(interval)
+            await asyncio.Event().wait()
+        finally:
+            scheduler.close()
 
-                with buffer_lock:
-                    if data_buffer:
-                        avg_val = sum(data_buffer) / len(data_buffer)
-                        count = len(data_buffer)
-                        data_buffer.clear()  # Clear queue for next window
 
-                        output = f"Average({count} samples): {avg_val:.2f}"
-                        print(f">> [Repub] {output}")
-                        pub.put(output)
-                    else:
-                        # Optional: Print if no data arrived in the window
-                        pass
+def main(
+    conf: zenoh.Config,
+    repub_key: str,
+    sub_key: str,
+    interval: float,
+    add_matching_listener: bool,
+    flush_count: Optional[int],
+    log: CallbackLog,
+):
+    zenoh.init_log_from_env_or("error")
+    print(f"Current Config: {conf}")
 
-        except KeyboardInterrupt:
-            print("\nShutting down...")
+    try:
+        asyncio.run(
+            run(
+                conf,
+                repub_key,
+                sub_key,
+                interval,
+                add_matching_listener,
+                flush_count,
+                log,
+            )
+        )
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        log.close()
 
 
 if __name__ == "__main__":
@@ -97,6 +127,7 @@ if __name__ == "__main__":
 
     if common:
         common.add_config_arguments(parser)
+    add_log_arguments(parser)
 
     parser.add_argument(
         "--key",
@@ -109,7 +140,18 @@ if __name__ == "__main__":
         "--sub-key", "-s", default="demo/example/**", help="Key to subscribe to."
     )
     parser.add_argument(
-        "--interval", "-i", type=float, default=5.0, help="Window interval in seconds."
+        "--interval",
+        "-i",
+        type=float,
+        default=5.0,
+        help="Deadline in seconds after a window's first sample.",
+    )
+    parser.add_argument(
+        "--count",
+        "-n",
+        dest="flush_count",
+        type=int,
+        help="Emit a window once this many samples arrived.",
     )
     parser.add_argument(
         "--add-matching-listener", action="store_true", help="Add matching listener"
@@ -118,4 +160,12 @@ if __name__ == "__main__":
     args = parser.parse_args()
     conf = common.get_config_from_args(args) if common else zenoh.Config()
 
-    main(conf, args.repub_key, args.sub_key, args.interval, args.add_matching_listener)
+    main(
+        conf,
+        args.repub_key,
+        args.sub_key,
+        args.interval,
+        args.add_matching_listener,
+        args.flush_count,
+        get_log_from_args(args),
+    )